@@ -8,6 +8,7 @@ from pathlib import Path
 from flask import Flask
 
 from db import close_db, DATA_DIR, MASTER_DB_PATH
+import jobs
 from helpers import (
     format_race, format_site_type, format_event_type,
     get_race_info, get_site_type_info, get_artifact_type_info,
@@ -27,6 +28,9 @@ def create_app():
     # Register teardown
     app.teardown_appcontext(close_db)
 
+    # Background import jobs
+    jobs.init_app(app)
+
     # Register template filters
     app.jinja_env.filters['race_label'] = format_race
     app.jinja_env.filters['site_type_label'] = format_site_type
@@ -6,81 +6,500 @@ Imports Dwarf Fortress legends XML data into SQLite database.
 
 import os
 import re
+import sys
 import json
 import sqlite3
-import tempfile
+import time
+import mmap
 import hashlib
+import tempfile
+import threading
+import traceback
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from queue import Empty, Queue
 from pathlib import Path
 from lxml import etree
 
+from exports import COMPRESSED_SUFFIXES, ARCHIVE_SUFFIX, upload_marker
+from extra_data import encode_extra, extra_json
+from world_schema import EVENT_EXTRA_COLUMNS, read_schema, table_columns
+
 # Paths
 BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
 WORLDS_DIR = DATA_DIR / "worlds"
 MASTER_DB_PATH = DATA_DIR / "master.db"
-SCHEMA_PATH = BASE_DIR / "schema.sql"
 MASTER_SCHEMA_PATH = BASE_DIR / "master_schema.sql"
 
-# XML files (user should place these in the base directory)
-LEGENDS_FILE = None
-LEGENDS_PLUS_FILE = None
+# Invalid XML 1.0 bytes (control chars except tab, newline, CR)
+INVALID_XML_BYTES = bytes(b for b in range(0x20) if b not in (0x09, 0x0a, 0x0d))
+# Encoding declaration written by Dwarf Fortress exports
+CP437_DECLARATION = re.compile(rb'encoding=["\']CP437["\']', re.IGNORECASE)
+# Top-level elements of <df_world>, for the section index
+SECTION_TAG = re.compile(rb'<([A-Za-z_][\w.-]*)\s*(/?)>')
+
+EXPORT_PATTERNS = ("*.xml",) + tuple(f"*.xml{suffix}" for suffix in COMPRESSED_SUFFIXES)
+
+# Seconds between checks for more bytes of an export still being uploaded (see exports.py)
+UPLOAD_POLL_INTERVAL = 0.2
+# Seconds without new bytes before an upload is given up on
+UPLOAD_STALL_TIMEOUT = 900
 
 
 def find_xml_files(legends_path=None, plus_path=None):
-    """Find or set legends XML files. legends_plus is optional."""
-    global LEGENDS_FILE, LEGENDS_PLUS_FILE
+    """
+    Find the legends XML files, from the given paths or else in the base
+    directory. Returns (legends, legends_plus), legends_plus None if there
+    is none (it is optional), or None if no legends export is found.
+    """
+    legends_file = plus_file = None
 
     # If paths provided via arguments, use them
     if legends_path:
-        LEGENDS_FILE = Path(legends_path)
+        legends_file = Path(legends_path)
         if plus_path:
-            LEGENDS_PLUS_FILE = Path(plus_path)
-        return LEGENDS_FILE.exists()
+            plus_file = Path(plus_path)
+        if not legends_file.exists():
+            return None
+        if legends_file.suffix.lower() == ARCHIVE_SUFFIX:
+            # An archive can hold both exports; an explicit plus_path wins
+            legends_file, zip_plus = find_zip_exports(legends_file)
+            if plus_file is None:
+                plus_file = zip_plus
+        elif plus_file is not None and plus_file.suffix.lower() == ARCHIVE_SUFFIX:
+            _, plus_file = find_zip_exports(plus_file)
+        return (legends_file, plus_file) if legends_file is not None else None
 
     # Otherwise, search in base directory
-    for f in BASE_DIR.glob("*.xml"):
+    for f in (f for pattern in EXPORT_PATTERNS for f in BASE_DIR.glob(pattern)):
         name = f.name.lower()
         if "legends_plus" in name:
-            LEGENDS_PLUS_FILE = f
+            plus_file = f
         elif "legends" in name:
-            LEGENDS_FILE = f
+            legends_file = f
 
     # Only legends.xml is required, legends_plus is optional
-    return LEGENDS_FILE is not None
+    return (legends_file, plus_file) if legends_file is not None else None
+
+
+class ZipMember:
+    """
+    An export stored in a .zip archive. Accepted wherever the import takes
+    an export path; it is decompressed as it is read, never extracted.
+    """
+
+    def __init__(self, path, name):
+        self.path = Path(path)
+        self.name = name
+
+    def __str__(self):
+        return f"{self.path}:{self.name}"
+
+
+def find_zip_exports(path):
+    """Return ZipMembers (legends, legends_plus) of an archive, either None if missing."""
+    legends = plus = None
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            name = Path(info.filename).name.lower()
+            if info.is_dir() or not name.endswith('.xml'):
+                continue
+            if "legends_plus" in name:
+                plus = ZipMember(path, info.filename)
+            elif "legends" in name:
+                legends = ZipMember(path, info.filename)
+    return legends, plus
+
+
+class UploadingFile:
+    """
+    An export file that is still being uploaded. Reads wait for more bytes
+    instead of stopping at the current end of the file, until the upload
+    marker is removed, so an import can start on the bytes received so far.
+    """
+
+    def __init__(self, path):
+        self.infile = open(path, 'rb')
+        self.marker = upload_marker(path)
+
+    def read(self, size=-1):
+        waited = 0.0
+        while True:
+            data = self.infile.read(size)
+            if size >= 0 and (data or size == 0):
+                return data
+            if not self.marker.exists():
+                # The marker goes only after the last chunk is written
+                return data + self.infile.read(size)
+            if data:
+                # read() means everything: wait for the rest
+                self.infile.seek(-len(data), os.SEEK_CUR)
+            if waited >= UPLOAD_STALL_TIMEOUT:
+                raise TimeoutError(f"No upload data for {self.infile.name} in {UPLOAD_STALL_TIMEOUT} seconds")
+            time.sleep(UPLOAD_POLL_INTERVAL)
+            waited += UPLOAD_POLL_INTERVAL
+
+    def __getattr__(self, name):
+        return getattr(self.infile, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.infile.close()
+
+
+def open_export(path):
+    """Open an export file for reading, waiting on it if it is still being uploaded."""
+    if upload_marker(path).exists():
+        return UploadingFile(path)
+    return open(path, 'rb')
+
+
+def is_compressed(filepath):
+    """Whether an export path (or ZipMember) must be decompressed to be read."""
+    if isinstance(filepath, FileSlice):
+        # Only uncompressed exports can be sliced
+        return False
+    return isinstance(filepath, ZipMember) or Path(filepath).suffix.lower() in COMPRESSED_SUFFIXES
+
+
+def export_size(filepath):
+    """Size of an export on disk: what its progress is measured in."""
+    if isinstance(filepath, FileSlice):
+        return sum(end - start for start, end in filepath.ranges)
+    if isinstance(filepath, ZipMember):
+        with zipfile.ZipFile(filepath.path) as archive:
+            return archive.getinfo(filepath.name).compress_size
+    marker = upload_marker(filepath)
+    try:
+        return int(marker.read_text())
+    except (OSError, ValueError):
+        # Not being uploaded
+        return os.path.getsize(filepath)
 
 
-def sanitize_xml_file(filepath):
+class FileSlice:
     """
-    Remove invalid XML 1.0 characters and return path to sanitized temp file.
-    Processes in chunks to handle large files.
-    Also converts CP437 encoding declaration to UTF-8.
+    Part of an XML export: the given (start, end) byte ranges of path,
+    read in order as if they were one file. Accepted wherever the import
+    takes an export path, e.g. to parse one shard of a section. label
+    names it in progress events, instead of the file name.
     """
-    print(f"  Sanitizing {filepath.name}...")
 
-    # Pattern for invalid XML 1.0 chars (control chars except tab, newline, CR)
-    invalid_chars = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
-    # Pattern to fix encoding declaration
-    encoding_pattern = re.compile(r'encoding=["\']CP437["\']', re.IGNORECASE)
+    def __init__(self, path, ranges, label=None):
+        self.path = path
+        self.ranges = ranges
+        self.label = label
+
+    def __str__(self):
+        return f"{self.path} (bytes {', '.join(f'{start}-{end}' for start, end in self.ranges)})"
+
 
-    temp_fd, temp_path = tempfile.mkstemp(suffix='.xml')
-    first_chunk = True
+def read_file_chunks(filepath, chunk_size, progress=None):
+    """
+    Yield the raw bytes of an export path or FileSlice, chunk_size at a time.
+    Bytes read from disk are counted on progress (a PassProgress), if given.
+    """
+    if is_compressed(filepath):
+        yield from read_compressed_chunks(filepath, chunk_size, progress)
+        return
 
-    with open(filepath, 'rb') as infile, os.fdopen(temp_fd, 'wb') as outfile:
+    if isinstance(filepath, FileSlice):
+        path, ranges = filepath.path, filepath.ranges
+    else:
+        path, ranges = filepath, [(0, None)]
+
+    with open_export(path) as infile:
+        for start, end in ranges:
+            infile.seek(start)
+            while end is None or start < end:
+                chunk = infile.read(chunk_size if end is None else min(chunk_size, end - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                if progress is not None:
+                    progress.advance(len(chunk))
+                yield chunk
+
+
+def read_compressed_chunks(filepath, chunk_size, progress=None):
+    """
+    Yield the decompressed bytes of a compressed export path or ZipMember.
+    Progress counts compressed bytes, read from the underlying file.
+    """
+    path = filepath.path if isinstance(filepath, ZipMember) else filepath
+    with open_export(path) as raw:
+        if isinstance(filepath, ZipMember):
+            archive = zipfile.ZipFile(raw)
+            infile = archive.open(filepath.name)
+        else:
+            archive = None
+            infile = COMPRESSED_SUFFIXES[Path(path).suffix.lower()](raw)
+        position = raw.tell()
+        try:
+            while True:
+                chunk = infile.read(chunk_size)
+                if not chunk:
+                    break
+                if progress is not None:
+                    progress.advance(raw.tell() - position)
+                    position = raw.tell()
+                yield chunk
+        finally:
+            infile.close()
+            if archive is not None:
+                archive.close()
+
+
+def scan_sections(path):
+    """
+    Find the byte offsets of every top-level element of an export (the
+    sections, plus leaves like <name>) without parsing it: each one ends
+    at the first closing tag with its name, which sections never nest.
+    Returns the index dict stored by load_section_index, or None if the
+    file doesn't have the expected shape.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        root_start = mm.find(b'<df_world>')
+        root_close = mm.rfind(b'</df_world>')
+        if root_start == -1 or root_close < root_start:
+            return None
+        root_start += len(b'<df_world>')
+
+        sections = []
+        pos = root_start
         while True:
-            chunk = infile.read(1024 * 1024)  # 1MB chunks
-            if not chunk:
+            start = mm.find(b'<', pos, root_close)
+            if start == -1:
                 break
-            # Decode from CP437, sanitize, encode as UTF-8
-            text = chunk.decode('cp437', errors='replace')
-            text = invalid_chars.sub('', text)
-            # Fix encoding declaration in first chunk
-            if first_chunk:
-                text = encoding_pattern.sub('encoding="UTF-8"', text)
-                first_chunk = False
-            outfile.write(text.encode('utf-8'))
+            match = SECTION_TAG.match(mm, start)
+            if match is None:
+                return None
+            tag = match.group(1)
+            if match.group(2):
+                end = match.end()
+            else:
+                end = mm.find(b'</' + tag + b'>', match.end(), root_close)
+                if end == -1:
+                    return None
+                end += len(tag) + 3
+            tag = tag.decode('ascii')
+            # A repeat means a closing tag was nested after all; don't guess
+            if any(tag == seen for seen, _, _ in sections):
+                return None
+            sections.append([tag, start, end])
+            pos = end
+
+    stat = os.stat(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'root': [root_start, root_close],
+        'sections': sections,
+    }
+
+
+def load_section_index(path):
+    """
+    Return the section index of an export (see scan_sections).
+
+    The index is kept next to the export as <name>.sections.json and is
+    rebuilt when the export's size or modification time changes. Compressed
+    exports can't be read at an offset, and exports still being uploaded
+    aren't complete, so neither has an index (None).
+    """
+    if is_compressed(path) or upload_marker(path).exists():
+        return None
+    index_path = Path(f"{path}.sections.json")
+    stat = os.stat(path)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['size'] == stat.st_size and index['mtime_ns'] == stat.st_mtime_ns:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = scan_sections(path)
+    if index is not None:
+        try:
+            with open(index_path, 'w') as f:
+                json.dump(index, f)
+        except OSError:
+            # Read-only export directory: the index just isn't kept
+            pass
+    return index
+
+
+def section_slice(filepath, sections):
+    """
+    Return a FileSlice of an export path (or FileSlice) keeping only the
+    named top-level sections inside <df_world>, so a pass over it skips
+    everything else. Returns filepath unchanged if it can't be indexed.
+    """
+    path, ranges, label = (
+        (filepath.path, filepath.ranges, filepath.label) if isinstance(filepath, FileSlice)
+        else (filepath, None, None)
+    )
+    index = load_section_index(path)
+    if index is None:
+        return filepath
+
+    root_start, root_close = index['root']
+    wanted = [(0, root_start)]
+    wanted += [(start, end) for tag, start, end in index['sections'] if tag in sections]
+    wanted.append((root_close, index['size']))
+    if ranges is not None:
+        # Keep only what the original slice had
+        wanted = [
+            (max(start, lo), min(end, index['size'] if hi is None else hi))
+            for start, end in wanted
+            for lo, hi in ranges
+        ]
+        wanted = [(start, end) for start, end in wanted if start < end]
+    return FileSlice(path, wanted, label)
+
+
+class ProgressLog:
+    """
+    Structured progress events for a running import, appended as JSON lines
+    to a file (see the --progress option). Does nothing until opened. Each
+    event is one short append, so forked workers can share the file.
+    """
+
+    # Seconds between events of one pass
+    interval = 1.0
+
+    def __init__(self):
+        self.path = None
+        self.lock = threading.Lock()
+
+    def open(self, path):
+        self.path = Path(path)
+        self.path.write_text('')
 
-    print("  Sanitization complete.")
-    return temp_path
+    def emit(self, phase, **fields):
+        if self.path is None:
+            return
+        line = json.dumps({'time': round(time.time(), 3), 'phase': phase, **fields}) + '\n'
+        with self.lock, open(self.path, 'a') as out:
+            out.write(line)
+
+    def step(self, phase):
+        """Record the start of a phase without a byte count, like building indexes."""
+        self.emit(phase, step=True)
+
+    def track(self, filepath):
+        """Get a PassProgress for one pass over an export path or FileSlice."""
+        return PassProgress(self, filepath)
+
+
+PROGRESS = ProgressLog()
+
+
+def export_label(filepath):
+    """Short name of an export path or FileSlice for progress output."""
+    if isinstance(filepath, FileSlice):
+        return filepath.label or Path(filepath.path).name
+    if isinstance(filepath, ZipMember):
+        return Path(filepath.name).name
+    return Path(filepath).name
+
+
+class PassProgress:
+    """
+    Progress of one pass over an export: records parsed and bytes read,
+    with rates and an ETA, emitted to a ProgressLog at most once a second.
+    """
+
+    def __init__(self, log, filepath):
+        self.log = log
+        self.phase = export_label(filepath)
+        self.total_bytes = export_size(filepath)
+        self.records = 0
+        self.bytes = 0
+        self.start = self.last = time.perf_counter()
+        self.emit(self.start)
+
+    def advance(self, nbytes):
+        self.bytes += nbytes
+        now = time.perf_counter()
+        if now - self.last >= self.log.interval:
+            self.last = now
+            self.emit(now)
+
+    def finish(self):
+        self.emit(time.perf_counter(), done=True)
+
+    def emit(self, now, done=False):
+        if self.log.path is None:
+            return
+        elapsed = now - self.start
+        bytes_per_sec = self.bytes / elapsed if elapsed > 0 else 0.0
+        eta = (self.total_bytes - self.bytes) / bytes_per_sec if bytes_per_sec and not done else 0.0
+        self.log.emit(self.phase, records=self.records, bytes=self.bytes, total_bytes=self.total_bytes,
+                      elapsed=round(elapsed, 2),
+                      records_per_sec=round(self.records / elapsed, 1) if elapsed > 0 else 0.0,
+                      bytes_per_sec=round(bytes_per_sec), eta=round(eta, 1), done=done)
+
+
+def sanitize_xml_chunks(filepath, chunk_size=1024 * 1024, progress=None):
+    """
+    Read an XML export and yield it as sanitized UTF-8 chunks.
+    Removes invalid XML 1.0 characters and transcodes CP437 exports to UTF-8
+    (fixing the encoding declaration), without writing a copy to disk.
+    Chunks of other files that are valid UTF-8 pass through as-is; those
+    that aren't (DFHack writes CP437 text into files declared UTF-8) are
+    transcoded from CP437 too.
+    Compressed exports are decompressed on the fly (see read_file_chunks).
+    Bytes read from disk are counted on progress (a PassProgress), if given.
+    """
+    transcode = None
+    # Start of a UTF-8 sequence split across chunks, for the next chunk
+    carry = b''
+    for chunk in read_file_chunks(filepath, chunk_size, progress):
+        if transcode is None:
+            # Only the declaration in the first chunk decides the encoding
+            chunk, transcode = CP437_DECLARATION.subn(b'encoding="UTF-8"', chunk, count=1)
+
+        # Control bytes never occur inside UTF-8 sequences, so delete them as bytes
+        chunk = carry + chunk.translate(None, INVALID_XML_BYTES)
+        carry = b''
+        # Pure ASCII is the same in CP437 and UTF-8
+        if chunk.isascii():
+            pass
+        elif transcode:
+            chunk = chunk.decode('cp437').encode('utf-8')
+        else:
+            try:
+                chunk.decode('utf-8')
+            except UnicodeDecodeError as e:
+                if e.reason == 'unexpected end of data':
+                    # Valid up to a sequence the next chunk completes
+                    chunk, carry = chunk[:e.start], chunk[e.start:]
+                else:
+                    chunk = chunk.decode('cp437').encode('utf-8')
+        yield chunk
+    if carry:
+        # The file ended inside the sequence, so it wasn't UTF-8
+        yield carry.decode('cp437').encode('utf-8')
+
+
+def iter_xml_events(filepath, events=('start', 'end'), progress=None):
+    """
+    Parse an XML export incrementally, yielding (event, element) pairs.
+    Sanitized chunks are fed straight into a pull parser, so the file is
+    read once per pass and never copied.
+    """
+    parser = etree.XMLPullParser(events=events)
+    for chunk in sanitize_xml_chunks(filepath, progress=progress):
+        parser.feed(chunk)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
 
 
 def xml_to_dict(element):
@@ -108,29 +527,153 @@ def xml_to_dict(element):
     return result
 
 
-def stream_elements(filepath, tag, callback, report_every=10000):
+class RecordSpec:
     """
-    Stream XML file and call callback for each element with given tag.
-    Uses iterparse for memory efficiency.
+    Compiled extractor for one record tag.
+
+    Reads a record element straight into a tuple: the text of each child
+    in fields (None if missing), then for each tag in children a list of
+    the matching child records, extracted with its own RecordSpec (or
+    their text, for a None spec), then the extra_data dict if extra is
+    set. Only child elements with children of their own count as child
+    records. Repeated fields keep their first value.
+
+    extra collects every child not in fields or children the way
+    xml_to_dict would. With extra='scalar', only values that are plain
+    text (not nested or repeated) are kept.
     """
-    count = 0
-    context = etree.iterparse(filepath, events=('end',), tag=tag)
 
+    def __init__(self, fields, children=None, extra=None):
+        self.fields = tuple(fields)
+        self.children = dict(children or {})
+        self.extra = extra
+        self.nfields = len(self.fields)
+        self.index = {tag: i for i, tag in enumerate(self.fields)}
+        self.index.update((tag, self.nfields + i) for i, tag in enumerate(self.children))
+        self.template = [None] * len(self.index)
+        self.child_slots = range(self.nfields, len(self.index))
+
+    def __call__(self, element):
+        values = self.template[:]
+        extra = None
+        keep_extra = self.extra
+        index = self.index
+        nfields = self.nfields
+
+        for child in element:
+            tag = child.tag
+            i = index.get(tag)
+            if i is not None:
+                if i < nfields:
+                    if values[i] is None:
+                        values[i] = child.text or ''
+                    continue
+                spec = self.children[tag]
+                if spec is None:
+                    value = child.text or ''
+                elif len(child):
+                    value = spec(child)
+                else:
+                    continue
+                if values[i] is None:
+                    values[i] = [value]
+                else:
+                    values[i].append(value)
+                continue
+            if not keep_extra:
+                continue
+
+            # Same shape as xml_to_dict for anything we don't have a column for
+            value = xml_to_dict(child) if len(child) else (child.text or '')
+            if extra is None:
+                extra = {tag: value}
+            elif tag in extra:
+                if not isinstance(extra[tag], list):
+                    extra[tag] = [extra[tag]]
+                extra[tag].append(value)
+            else:
+                extra[tag] = value
+
+        for i in self.child_slots:
+            if values[i] is None:
+                values[i] = ()
+        if keep_extra:
+            if extra and keep_extra == 'scalar':
+                extra = {k: v for k, v in extra.items() if isinstance(v, str)}
+            values.append(extra)
+        return tuple(values)
+
+
+def iter_records(filepath, specs, counts, report_every=10000, checkpoints=None):
+    """
+    Stream XML file once, yielding (tag, record) for each top-level record
+    with a RecordSpec in specs, and counting it in counts.
+
+    Only records directly inside a section of <df_world> are yielded, so
+    nested elements sharing a tag (like <site> inside a legends_plus event)
+    are ignored. Other records are cleared unparsed. Progress of the pass
+    is reported to PROGRESS.
+
+    With checkpoints (an ImportCheckpoints), records it has already
+    imported are skipped, and it is told once each record has been handled
+    and each section finished.
+    """
+    depth = 0
+    skipping = False
+    progress = PROGRESS.track(filepath)
+
+    context = iter_xml_events(filepath, progress=progress)
     for event, elem in context:
-        data = xml_to_dict(elem)
-        callback(data)
-        count += 1
+        if event == 'start':
+            depth += 1
+            if depth == 2 and checkpoints is not None:
+                skipping = checkpoints.start_section(elem.tag)
+            continue
+
+        # depth 3 means a record inside a section (df_world > regions > region)
+        if depth == 3:
+            tag = elem.tag
+            spec = specs.get(tag)
+            if spec is not None and not skipping:
+                record = spec(elem)
+                if checkpoints is None or not checkpoints.skip_record(tag, record):
+                    counts[tag] += 1
+                    progress.records += 1
+                    if counts[tag] % report_every == 0:
+                        print(f"    Processed {counts[tag]} {tag} records...")
+                    yield tag, record
+                    if checkpoints is not None:
+                        checkpoints.record_done(tag, record)
+
+            # Clear element to free memory
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        elif depth == 2 and checkpoints is not None and not skipping:
+            checkpoints.section_done(elem.tag)
+        depth -= 1
+
+    context.close()
+    progress.finish()
+    if checkpoints is not None:
+        checkpoints.finish()
 
-        if count % report_every == 0:
-            print(f"    Processed {count} {tag} records...")
 
-        # Clear element to free memory
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
+def stream_sections(filepath, handlers, report_every=10000, checkpoints=None):
+    """
+    Stream XML file once and dispatch each top-level record to its handler.
 
-    del context
-    return count
+    handlers maps a record tag (e.g. 'region', 'historical_event') to a
+    (RecordSpec, callback) pair; the callback takes the extracted record.
+    Returns a dict of record counts per handled tag. checkpoints is passed
+    on to iter_records.
+    """
+    specs = {tag: spec for tag, (spec, _) in handlers.items()}
+    callbacks = {tag: callback for tag, (_, callback) in handlers.items()}
+    counts = dict.fromkeys(handlers, 0)
+    for tag, record in iter_records(filepath, specs, counts, report_every, checkpoints):
+        callbacks[tag](record)
+    return counts
 
 
 def get_world_info(filepath):
@@ -141,7 +684,7 @@ def get_world_info(filepath):
     name = altname = None
     depth = 0
 
-    context = etree.iterparse(filepath, events=('start', 'end'))
+    context = iter_xml_events(section_slice(filepath, ('name', 'altname')))
     for event, elem in context:
         if event == 'start':
             depth += 1
@@ -158,7 +701,7 @@ def get_world_info(filepath):
             if (name and altname) or depth == 1 and elem.tag in ('regions', 'sites', 'artifacts'):
                 break
 
-    del context
+    context.close()
     return name, altname
 
 
@@ -170,7 +713,7 @@ def get_world_info_from_legends(filepath):
     name = None
     depth = 0
 
-    context = etree.iterparse(filepath, events=('start', 'end'))
+    context = iter_xml_events(section_slice(filepath, ('name',)))
     for event, elem in context:
         if event == 'start':
             depth += 1
@@ -183,7 +726,7 @@ def get_world_info_from_legends(filepath):
             depth -= 1
             elem.clear()
 
-    del context
+    context.close()
     return name, None
 
 
@@ -192,32 +735,43 @@ def init_master_db():
     DATA_DIR.mkdir(exist_ok=True)
     WORLDS_DIR.mkdir(exist_ok=True)
 
-    conn = sqlite3.connect(MASTER_DB_PATH)
+    # Concurrent imports (see run_batch) wait on each other's writes
+    conn = sqlite3.connect(MASTER_DB_PATH, timeout=30)
     conn.row_factory = sqlite3.Row
 
     with open(MASTER_SCHEMA_PATH) as f:
         conn.executescript(f.read())
 
-    # Migration: add has_plus column if it doesn't exist
+    # Migration: add has_plus column if it doesn't exist. Checked and
+    # applied in one write transaction, so concurrent imports migrate once.
     cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
     cursor.execute("PRAGMA table_info(worlds)")
     columns = [row[1] for row in cursor.fetchall()]
     if 'has_plus' not in columns:
         cursor.execute("ALTER TABLE worlds ADD COLUMN has_plus INTEGER DEFAULT 0")
-        conn.commit()
+    if 'content_hash' not in columns:
+        cursor.execute("ALTER TABLE worlds ADD COLUMN content_hash TEXT")
+    if 'status' not in columns:
+        cursor.execute("ALTER TABLE worlds ADD COLUMN status TEXT DEFAULT 'complete'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_worlds_content_hash ON worlds(content_hash)")
+    conn.commit()
 
     return conn
 
 
 def generate_world_id(name):
-    """Generate a unique ID for a world based on name and timestamp."""
-    import time
-    raw = f"{name or 'unknown'}_{time.time()}"
+    """Generate a unique ID for a world based on name, timestamp and a random part."""
+    raw = f"{name or 'unknown'}_{time.time()}_{os.urandom(8).hex()}"
     return hashlib.md5(raw.encode()).hexdigest()[:12]
 
 
-def register_world(name, altname, db_path, has_plus=False):
-    """Register a world in the master database and set it as current."""
+def register_world(name, altname, db_path, has_plus=False, content_hash=None, status='complete'):
+    """
+    Register a world in the master database and set it as current.
+    content_hash identifies the exports it was imported from (see content_hash()).
+    A 'partial' world is still being imported (see complete_world).
+    """
     conn = init_master_db()
     cursor = conn.cursor()
 
@@ -225,13 +779,16 @@ def register_world(name, altname, db_path, has_plus=False):
     display_name = name or "Unknown World"
     world_id = generate_world_id(name)
 
-    # Unset any current world
+    # Unset any current world, in the same transaction as the insert so
+    # concurrent imports leave exactly one current world
+    cursor.execute("BEGIN IMMEDIATE")
     cursor.execute("UPDATE worlds SET is_current = 0 WHERE is_current = 1")
 
     # Insert new world as current
     cursor.execute(
-        "INSERT INTO worlds (id, name, altname, db_path, is_current, has_plus) VALUES (?, ?, ?, ?, 1, ?)",
-        (world_id, display_name, altname, str(db_path), 1 if has_plus else 0)
+        "INSERT INTO worlds (id, name, altname, db_path, is_current, has_plus, content_hash, status)"
+        " VALUES (?, ?, ?, ?, 1, ?, ?, ?)",
+        (world_id, display_name, altname, str(db_path), 1 if has_plus else 0, content_hash, status)
     )
 
     conn.commit()
@@ -240,526 +797,1886 @@ def register_world(name, altname, db_path, has_plus=False):
     return world_id
 
 
+def complete_world(world_id, content_hash):
+    """Mark a world registered as 'partial' as fully imported from the exports with this content hash."""
+    conn = init_master_db()
+    conn.execute("UPDATE worlds SET status = 'complete', content_hash = ? WHERE id = ?", (content_hash, world_id))
+    conn.commit()
+    conn.close()
+
+
+def unregister_world(world_id):
+    """Remove a world from the master database, leaving its database file alone."""
+    conn = init_master_db()
+    conn.execute("DELETE FROM worlds WHERE id = ?", (world_id,))
+    conn.commit()
+    conn.close()
+
+
+def find_partial_world(db_path):
+    """Get the id of the world registered as 'partial' for a database, or None."""
+    conn = init_master_db()
+    rows = conn.execute("SELECT id, db_path FROM worlds WHERE status = 'partial'").fetchall()
+    conn.close()
+    for row in rows:
+        if Path(row['db_path']).resolve() == Path(db_path).resolve():
+            return row['id']
+    return None
+
+
+def record_job_world(job_id, world_id):
+    """Record the world an import job created on its row in the master database."""
+    conn = init_master_db()
+    conn.execute("UPDATE jobs SET world_id = ? WHERE id = ?", (world_id, job_id))
+    conn.commit()
+    conn.close()
+
+
 def update_world_has_plus(world_id):
-    """Mark a world as having legends_plus data."""
+    """
+    Mark a world as having legends_plus data. It no longer matches the
+    exports it was imported from, so it leaves the import cache.
+    """
     conn = init_master_db()
     cursor = conn.cursor()
-    cursor.execute("UPDATE worlds SET has_plus = 1 WHERE id = ?", (world_id,))
+    cursor.execute("UPDATE worlds SET has_plus = 1, content_hash = NULL WHERE id = ?", (world_id,))
     conn.commit()
     conn.close()
 
 
-def init_world_db(db_path):
-    """Initialize a world database with schema."""
+def content_hash(legends_path, plus_path=None):
+    """
+    Hash what an import reads: the decompressed bytes of legends.xml and of
+    legends_plus.xml, if any. The same exports hash the same whatever their
+    file names or compression. Hashing runs far faster than parsing.
+    """
+    digest = hashlib.sha256()
+    for path in (legends_path, plus_path):
+        file_digest = hashlib.sha256()
+        if path is not None:
+            for chunk in read_file_chunks(path, 1024 * 1024):
+                file_digest.update(chunk)
+        # Keeps legends-only imports apart from ones with an empty legends_plus
+        digest.update(b'-' if path is None else file_digest.digest())
+    return digest.hexdigest()
+
+
+def find_cached_world(content_hash, compact_extra=False):
+    """
+    Get a world imported from exports with this content hash, if its
+    database is still there and stores extra_data compact or as JSON text
+    as compact_extra asks.
+    """
+    conn = init_master_db()
+    rows = conn.execute(
+        "SELECT * FROM worlds WHERE content_hash = ? ORDER BY created_at", (content_hash,)
+    ).fetchall()
+    conn.close()
+    for row in rows:
+        if not Path(row['db_path']).exists():
+            continue
+        world = sqlite3.connect(row['db_path'])
+        try:
+            compact = has_compact_extra(world)
+        except sqlite3.Error:
+            # Worlds from before event_extra only have JSON text
+            compact = False
+        finally:
+            world.close()
+        if compact == compact_extra:
+            return dict(row)
+    return None
+
+
+def acquire_import_lock(db_path):
+    """
+    Take the lock marking a world database as being imported by this
+    process, or return None if a running import holds it. The lock is an
+    exclusive transaction on <db_path>.lock, which the OS releases if the
+    process dies. Release it with release_import_lock.
+    """
+    lock = sqlite3.connect(f"{db_path}.lock", timeout=0, isolation_level=None)
+    try:
+        lock.execute("BEGIN EXCLUSIVE")
+    except sqlite3.OperationalError:
+        lock.close()
+        return None
+    return lock
+
+
+def release_import_lock(lock, db_path):
+    """Release a lock taken by acquire_import_lock."""
+    lock.close()
+    Path(f"{db_path}.lock").unlink(missing_ok=True)
+
+
+def discard_world_db(db_path):
+    """Delete a world database (or bulk staging file) along with its WAL files, checkpoints and all."""
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        Path(path).unlink(missing_ok=True)
+
+
+def find_interrupted_import(content_hash):
+    """
+    Find an interrupted import of exports with this content hash: a world
+    database (or bulk staging file) with import checkpoints that isn't
+    registered, or only as 'partial', and that no running import holds.
+    Returns (path, lock) with its import lock taken, or None.
+    """
+    def registered_paths():
+        conn = init_master_db()
+        paths = {Path(row['db_path']).resolve()
+                 for row in conn.execute("SELECT db_path FROM worlds WHERE status IS NOT 'partial'")}
+        conn.close()
+        return paths
+
+    registered = registered_paths()
+    for path in sorted(WORLDS_DIR.glob('*.db')) + sorted(WORLDS_DIR.glob('*.db.importing')):
+        # Bulk loads are staged in <world id>.db.importing
+        db_path = path.with_suffix('') if path.suffix == '.importing' else path
+        if db_path.resolve() in registered:
+            continue
+        try:
+            world = sqlite3.connect(path)
+            try:
+                found = world.execute(
+                    "SELECT 1 FROM import_checkpoints WHERE content_hash = ?", (content_hash,)
+                ).fetchone()
+            finally:
+                world.close()
+        except sqlite3.Error:
+            # Not a world database, or one from before checkpoints
+            continue
+        if found:
+            lock = acquire_import_lock(db_path)
+            if lock is None:
+                continue
+            # Imports complete their world before releasing the lock
+            if path.exists() and db_path.resolve() not in registered_paths():
+                return path, lock
+            release_import_lock(lock, db_path)
+    return None
+
+
+def set_current_world(world_id):
+    """Make a registered world the current one."""
+    conn = init_master_db()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("UPDATE worlds SET is_current = 0 WHERE is_current = 1")
+    conn.execute("UPDATE worlds SET is_current = 1 WHERE id = ?", (world_id,))
+    conn.commit()
+    conn.close()
+
+
+def clone_world_db(source_path, db_path):
+    """Copy a world database with the SQLite backup API, safe even while it is being read."""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def init_world_db(db_path, bulk=False, compact_extra=False):
+    """
+    Initialize a world database with schema. Events written through it
+    store extra_data compact with compact_extra (see extra_data.py).
+
+    In bulk mode the database is a staging file: only tables are created,
+    and writes skip fsync. It is still journaled, so a killed import leaves
+    it at its last commit, to resume from. Call finish_bulk_load once the
+    data is in.
+    """
     # Ensure worlds directory exists
     db_path = Path(db_path)
     db_path.parent.mkdir(parents=True, exist_ok=True)
 
     conn = sqlite3.connect(db_path)
     conn.execute("PRAGMA foreign_keys = ON")
-    conn.execute("PRAGMA journal_mode = WAL")
+    register_extra_functions(conn, compact_extra)
 
-    # Read and execute schema
-    with open(SCHEMA_PATH) as f:
-        conn.executescript(f.read())
+    tables, indexes = read_schema()
+    conn.execute("PRAGMA journal_mode = WAL")
+    if bulk:
+        conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(tables)
+    # A database resumed from an older import may lack newer columns
+    migrate_world_db(conn, indexes=False)
+    if not bulk:
+        conn.executescript(indexes)
 
     return conn
 
 
-def run_import(legends_path=None, plus_path=None):
-    """Main import function."""
-    print("=" * 50)
-    print("DF Tales XML Import")
-    print("=" * 50)
+def register_extra_functions(conn, compact_extra=False):
+    """
+    Register the SQL functions for extra_data on a world connection:
+    encode_extra(), which event inserts store the JSON text through (as a
+    compact BLOB with compact_extra), and extra_json(), which reads either.
+    """
+    conn.create_function('encode_extra', 1, encode_extra if compact_extra else lambda text: text,
+                         deterministic=True)
+    conn.create_function('extra_json', 1, extra_json, deterministic=True)
 
-    # Find XML files
-    if not find_xml_files(legends_path, plus_path):
-        print("\nERROR: Could not find XML files!")
-        print("Please place your legends XML file in:", BASE_DIR)
-        print("Expected: *legends.xml (required)")
-        print("Optional: *legends_plus.xml (DFHack export for additional data)")
-        return False
 
-    has_plus = LEGENDS_PLUS_FILE is not None
+def has_compact_extra(conn):
+    """Whether a world database stores extra_data compact, going by its first event that has any."""
+    row = conn.execute(
+        "SELECT typeof(extra_data) FROM event_extra WHERE extra_data IS NOT NULL LIMIT 1"
+    ).fetchone()
+    return row is not None and row[0] == 'blob'
 
-    print(f"\nUsing XML files:")
-    print(f"  Legends: {LEGENDS_FILE}")
+
+def migrate_world_db(conn, indexes=True):
+    """
+    Bring a world database from an older import up to the current schema:
+    new tables are created, the EVENT_EXTRA_COLUMNS historical_events
+    columns added and filled in from extra_data, extra_data moved out of
+    historical_events to event_extra, event_participants populated if it
+    is new, and with indexes, any missing index built.
+    Returns True if anything was migrated.
+    """
+    conn.create_function('extra_json', 1, extra_json, deterministic=True)
+    tables, index_statements = read_schema()
+    # Databases too old to have the table, not new ones with no events yet
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    new_participants = 'historical_events' in existing and 'event_participants' not in existing
+    conn.executescript(tables)
+
+    columns = table_columns(conn, 'historical_events')
+    missing = [(column, key) for column, key in EVENT_EXTRA_COLUMNS if column not in columns]
+    if missing:
+        print(f"\nMigrating {len(missing)} event columns out of extra_data...")
+        with conn:
+            for column, _ in missing:
+                conn.execute(f"ALTER TABLE historical_events ADD COLUMN {column} INTEGER")
+            # Same values as event_extra_ids(): text that is a whole number.
+            # Databases this old only have extra_data as JSON text.
+            assignments = ', '.join(
+                f"""{column} = CASE WHEN json_type(extra_data, '$.{key}') = 'text'
+                    AND CAST(CAST(json_extract(extra_data, '$.{key}') AS INTEGER) AS TEXT)
+                        = json_extract(extra_data, '$.{key}')
+                    THEN CAST(json_extract(extra_data, '$.{key}') AS INTEGER) END"""
+                for column, key in missing
+            )
+            conn.execute(f"UPDATE historical_events SET {assignments} WHERE extra_data IS NOT NULL")
+    legacy_extra = 'extra_data' in columns
+    if legacy_extra:
+        print("\nMoving event extra_data to event_extra...")
+        with conn:
+            conn.execute("""
+                INSERT INTO event_extra (event_id, extra_data)
+                SELECT id, extra_data FROM historical_events WHERE extra_data IS NOT NULL
+            """)
+            conn.execute("ALTER TABLE historical_events DROP COLUMN extra_data")
+    if new_participants:
+        with conn:
+            populate_event_participants(conn.cursor())
+    if indexes:
+        conn.executescript(index_statements)
+    return bool(missing) or legacy_extra or new_participants
+
+
+def build_indexes(conn):
+    """Create the schema indexes skipped by a bulk load."""
+    print("\nBuilding indexes...")
+    PROGRESS.step("Building indexes")
+    _, indexes = read_schema()
+    conn.executescript(indexes)
+
+
+def finish_bulk_load(conn, staging_path, db_path):
+    """Analyze a bulk-loaded staging database and atomically move it into place."""
+    print("\nAnalyzing database...")
+    PROGRESS.step("Analyzing database")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    os.replace(staging_path, db_path)
+
+
+# Sections read by import_legends and import_legends_plus
+LEGENDS_SECTIONS = ('regions', 'underground_regions', 'sites', 'artifacts',
+                    'historical_figures', 'historical_events')
+PLUS_SECTIONS = ('regions', 'landmasses', 'mountain_peaks', 'sites', 'entities', 'creature_raw',
+                 'rivers', 'world_constructions', 'historical_event_relationships',
+                 'historical_events', 'artifacts', 'written_contents')
+
+# legends.xml event ids and years, for legends_plus events
+EVENT_YEAR_SPEC = RecordSpec(('id', 'year'))
+
+# Indexed columns of event extra_data ids (see world_schema.py), for inserts
+EVENT_EXTRA_COLUMN_LIST = ', '.join(column for column, _ in EVENT_EXTRA_COLUMNS)
+
+# Events' other fields go to event_extra, as JSON text or compact (see register_extra_functions)
+EVENT_EXTRA_SQL = "INSERT INTO event_extra (event_id, extra_data) VALUES (?, encode_extra(?))"
+
+# Event fields naming a historical figure, in legends.xml or legends_plus
+# (besides the hfid and slayer_hfid columns, and any '*_hfid' field),
+# as kept in extra_data. Repeated ones (group, bodies) are lists.
+EVENT_FIGURE_KEYS = (
+    'hfid1', 'hfid2', 'hfid_target', 'hf', 'hf_target', 'histfig', 'hist_figure_id', 'hist_fig_id',
+    'giver_hist_figure_id', 'receiver_hist_figure_id', 'victim_hf', 'seeker_hf', 'target_hf', 'builder_hf',
+    'trickster', 'changee', 'changer', 'woundee', 'wounder', 'eater', 'victim', 'maker', 'group', 'bodies',
+)
+
+
+def event_extra_ids(extra):
+    """
+    Values of an event's EVENT_EXTRA_COLUMNS from its extra_data dict, as
+    integers. Keys that are missing, nested or not a number give None.
+    """
+    values = []
+    for _, key in EVENT_EXTRA_COLUMNS:
+        value = extra.get(key) if extra else None
+        try:
+            values.append(int(value) if isinstance(value, str) else None)
+        except ValueError:
+            values.append(None)
+    return tuple(values)
+
+
+def legends_event_handler(cursor):
+    """
+    Return the (RecordSpec, callback) pair importing legends.xml events.
+    Only used without legends_plus (less detailed, but has years).
+    """
+    spec = RecordSpec(('id', 'year', 'type', 'site_id', 'hfid', 'civ_id',
+                       'slayer_hfid', 'death_cause', 'artifact_id', 'entity_id',
+                       'structure_id'), extra='scalar')
+
+    event_sql = f"""INSERT INTO historical_events
+               (id, year, type, site_id, hfid, civ_id, slayer_hfid,
+                death_cause, artifact_id, entity_id, structure_id, {EVENT_EXTRA_COLUMN_LIST})
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?{', ?' * len(EVENT_EXTRA_COLUMNS)})"""
+
+    def import_event_basic(row):
+        extra = row[-1]
+        cursor.execute(event_sql, row[:-1] + event_extra_ids(extra))
+        if extra:
+            cursor.execute(EVENT_EXTRA_SQL, (row[0], json.dumps(extra)))
+
+    return spec, import_event_basic
+
+
+def plus_event_handler(cursor, event_years, merge=False):
+    """
+    Return the (RecordSpec, callback) pair importing legends_plus events
+    (full event data), with years looked up in event_years.
+    """
+    # 'year' is listed so that it is left out of extra_data
+    spec = RecordSpec(('id', 'type', 'site_id', 'site', 'hfid', 'civ_id', 'civ', 'state', 'reason',
+                       'slayer_hfid', 'slayer_hf', 'death_cause', 'artifact_id', 'entity_id',
+                       'structure_id', 'year'), extra='all')
+
+    # In merge mode existing events keep the year imported from legends.xml
+    event_sql = f"""INSERT INTO historical_events
+               (id, year, type, site_id, hfid, civ_id, state, reason, slayer_hfid,
+                death_cause, artifact_id, entity_id, structure_id, {EVENT_EXTRA_COLUMN_LIST})
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?{', ?' * len(EVENT_EXTRA_COLUMNS)})"""
+    extra_sql = EVENT_EXTRA_SQL
+    if merge:
+        event_sql += """
+               ON CONFLICT(id) DO UPDATE SET
+               type = excluded.type, site_id = excluded.site_id, hfid = excluded.hfid,
+               civ_id = excluded.civ_id, state = excluded.state, reason = excluded.reason,
+               slayer_hfid = excluded.slayer_hfid, death_cause = excluded.death_cause,
+               artifact_id = excluded.artifact_id, entity_id = excluded.entity_id,
+               structure_id = excluded.structure_id, """
+        event_sql += ', '.join(f"{column} = excluded.{column}" for column, _ in EVENT_EXTRA_COLUMNS)
+        # legends_plus fields replace those from legends.xml
+        extra_sql += " ON CONFLICT(event_id) DO UPDATE SET extra_data = excluded.extra_data"
+    def import_event_plus(row):
+        (event_id, event_type, site_id, site, hfid, civ_id, civ, state, reason,
+         slayer_hfid, slayer_hf, death_cause, artifact_id, entity_id, structure_id,
+         _, extra) = row
+        year = event_years.get(int(event_id)) if event_id is not None else None
+        cursor.execute(
+            event_sql,
+            (event_id, year, event_type, site_id or site, hfid, civ_id or civ, state, reason,
+             slayer_hfid or slayer_hf, death_cause, artifact_id, entity_id, structure_id)
+            + event_extra_ids(extra)
+        )
+        if extra:
+            cursor.execute(extra_sql, (event_id, json.dumps(extra)))
+        elif merge:
+            cursor.execute("DELETE FROM event_extra WHERE event_id = ?", (event_id,))
+
+    return spec, import_event_plus
+
+
+def iter_event_years(legends_path, counts):
+    """Yield (event_id, year) for the legends.xml events in legends_path."""
+    for _, (event_id, year) in iter_records(legends_path, {'historical_event': EVENT_YEAR_SPEC}, counts):
+        if event_id is not None and year is not None:
+            yield int(event_id), int(year)
+
+
+def import_legends(cursor, legends_path, has_plus, checkpoints=None):
+    """
+    Import every legends.xml section in a single streaming pass.
+
+    This is a generator. With legends_plus present, events are imported
+    from there instead, and the pass yields (event_id, year) pairs as it
+    reaches them, so the caller can merge-join them with legends_plus
+    events. Without legends_plus nothing is yielded, but the generator
+    still has to be exhausted to finish the pass. checkpoints is passed
+    on to iter_records.
+    """
+    # Regions
+    def import_region(row):
+        cursor.execute("INSERT OR REPLACE INTO regions (id, name, type) VALUES (?, ?, ?)", row)
+
+    # Underground regions
+    def import_underground(row):
+        cursor.execute("INSERT OR REPLACE INTO underground_regions (id, type, depth) VALUES (?, ?, ?)", row)
+
+    # Sites
+    def import_site(row):
+        cursor.execute("INSERT OR REPLACE INTO sites (id, name, type, coords, rectangle) VALUES (?, ?, ?, ?, ?)", row)
+
+    # Artifacts
+    def import_artifact(row):
+        artifact_id, name, name_string = row[:3]
+        cursor.execute(
+            """INSERT OR REPLACE INTO artifacts
+               (id, name, item_type, item_subtype, mat, creator_hfid, site_id, holder_hfid)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (artifact_id, name or name_string) + row[3:]
+        )
+
+    # Historical figures (legends.xml has names)
+    entity_link_count = site_link_count = hf_link_count = 0
+    def import_hf(row):
+        nonlocal entity_link_count, site_link_count, hf_link_count
+        hfid = row[0]
+        entity_links, site_links, hf_links = row[7:]
+        cursor.execute(
+            "INSERT OR REPLACE INTO historical_figures (id, name, race, caste, sex, birth_year, death_year) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            row[:7]
+        )
+
+        # Entity links
+        for link in entity_links:
+            cursor.execute(
+                "INSERT INTO hf_entity_links (hfid, entity_id, link_type, link_strength) VALUES (?, ?, ?, ?)",
+                (hfid,) + link
+            )
+        entity_link_count += len(entity_links)
+
+        # Site links
+        for slink in site_links:
+            cursor.execute(
+                "INSERT INTO hf_site_links (hfid, site_id, link_type) VALUES (?, ?, ?)",
+                (hfid,) + slink
+            )
+        site_link_count += len(site_links)
+
+        # HF links (family relationships: child, spouse, etc.)
+        for target_hfid, link_type in hf_links:
+            link_type = (link_type or '').replace(' ', '_')
+            if target_hfid and link_type:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO hf_relationships (source_hf, target_hf, relationship, year) VALUES (?, ?, ?, ?)",
+                    (hfid, target_hfid, link_type, None)
+                )
+                hf_link_count += 1
+
+    # Historical events: with legends_plus present, only their years come from here
     if has_plus:
-        print(f"  Legends+: {LEGENDS_PLUS_FILE}")
+        event_spec = EVENT_YEAR_SPEC
     else:
-        print("  Legends+: Not provided (some features will be limited)")
+        event_spec, import_event_basic = legends_event_handler(cursor)
+
+    handlers = {
+        'region': (RecordSpec(('id', 'name', 'type')), import_region),
+        'underground_region': (RecordSpec(('id', 'type', 'depth')), import_underground),
+        'site': (RecordSpec(('id', 'name', 'type', 'coords', 'rectangle')), import_site),
+        'artifact': (RecordSpec(('id', 'name', 'name_string', 'item_type', 'item_subtype', 'mat',
+                                 'creator_hfid', 'site_id', 'holder_hfid')), import_artifact),
+        'historical_figure': (RecordSpec(
+            ('id', 'name', 'race', 'caste', 'sex', 'birth_year', 'death_year'),
+            children={
+                'entity_link': RecordSpec(('entity_id', 'link_type', 'link_strength')),
+                'site_link': RecordSpec(('site_id', 'link_type')),
+                'hf_link': RecordSpec(('hfid', 'link_type')),
+            }), import_hf),
+    }
+    if not has_plus:
+        handlers['historical_event'] = (event_spec, import_event_basic)
+
+    print("\nImporting regions, sites, artifacts, historical figures and events...")
+    specs = {tag: spec for tag, (spec, _) in handlers.items()}
+    specs['historical_event'] = event_spec
+    counts = dict.fromkeys(specs, 0)
+    year_count = 0
+    for tag, row in iter_records(section_slice(legends_path, LEGENDS_SECTIONS), specs, counts,
+                                 checkpoints=checkpoints):
+        if tag in handlers:
+            handlers[tag][1](row)
+            continue
+        event_id, year = row
+        if event_id is not None and year is not None:
+            year_count += 1
+            yield int(event_id), int(year)
+
+    print(f"  Imported {counts['region']} regions.")
+    print(f"  Imported {counts['underground_region']} underground regions.")
+    print(f"  Imported {counts['site']} sites.")
+    print(f"  Imported {counts['artifact']} artifacts.")
+    print(f"  Imported {counts['historical_figure']} historical figures, {entity_link_count} entity links, {site_link_count} site links, {hf_link_count} family links.")
+    if has_plus:
+        print(f"  Read years for {year_count} events from legends.xml")
+    else:
+        print(f"  Imported {counts['historical_event']} historical events.")
 
-    # Sanitize XML files
-    print("\nSanitizing XML files...")
-    legends_clean = sanitize_xml_file(LEGENDS_FILE)
-    legends_plus_clean = sanitize_xml_file(LEGENDS_PLUS_FILE) if has_plus else None
 
-    try:
-        # First, get world info to determine database name
-        print("\nReading world info...")
-        if has_plus:
-            name, altname = get_world_info(legends_plus_clean)
+class EventYearJoin:
+    """
+    Merge-join of legends.xml event years with legends_plus events.
+
+    Wraps the (event_id, year) pairs yielded by import_legends and looks
+    years up for import_legends_plus by advancing through them. Both
+    exports list events in ascending id order, so the legends.xml stream
+    only ever moves forward and nothing needs to be held in memory. Years
+    passed over without a lookup are kept aside in case the order differs.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.skipped = {}
+        self.matched = 0
+        self.missing = 0
+        # Start the legends.xml pass, importing everything before its events
+        self.current = next(self.pairs, None)
+
+    def get(self, event_id):
+        year = self.skipped.pop(event_id, None)
+        if year is None:
+            while self.current is not None and self.current[0] < event_id:
+                self.skipped[self.current[0]] = self.current[1]
+                self.current = next(self.pairs, None)
+            if self.current is not None and self.current[0] == event_id:
+                year = self.current[1]
+                self.current = next(self.pairs, None)
+        if year is None:
+            self.missing += 1
         else:
-            name, altname = get_world_info_from_legends(legends_clean)
-        print(f"  World: {name}" + (f" ({altname})" if altname else ""))
+            self.matched += 1
+        return year
 
-        # Generate world ID and database path
-        world_id = generate_world_id(name)
-        db_path = WORLDS_DIR / f"{world_id}.db"
+    def finish(self):
+        """Run the rest of the legends.xml pass."""
+        for _ in self.pairs:
+            pass
 
-        # Initialize world database
-        print(f"\nInitializing database: {db_path.name}")
-        conn = init_world_db(db_path)
-        cursor = conn.cursor()
 
-        # Insert world info (use fallback if no name from vanilla legends.xml)
-        cursor.execute("INSERT INTO world (name, altname) VALUES (?, ?)", (name or "Unknown World", altname))
-        conn.commit()
+def import_legends_plus(cursor, plus_path, event_years, merge=False, checkpoints=None):
+    """
+    Import every legends_plus.xml section in a single streaming pass.
+
+    Shared by run_import and run_merge_plus. event_years looks up event
+    years by id (an EventYearJoin), since legends_plus events don't carry
+    years. In merge mode rows may already exist, so existing events keep
+    their year and artifacts missing from the database are added.
+    Returns a dict of record counts per tag. checkpoints is passed on to
+    iter_records.
+    """
+    insert = "INSERT OR REPLACE" if merge else "INSERT"
+
+    # Update regions with coordinates and evilness from legends_plus
+    def update_region_data(row):
+        if row[-1] is not None:
+            cursor.execute("UPDATE regions SET coords = ?, evilness = ? WHERE id = ?", row)
+
+    # Landmasses
+    def import_landmass(row):
+        cursor.execute(f"{insert} INTO landmasses (id, name, coord_1, coord_2) VALUES (?, ?, ?, ?)", row)
+
+    # Mountain peaks
+    def import_peak(row):
+        cursor.execute(
+            f"{insert} INTO mountain_peaks (id, name, coords, height, is_volcano) VALUES (?, ?, ?, ?, ?)",
+            row[:4] + (1 if row[4] is not None else 0,)
+        )
+
+    # Update sites + structures
+    structure_count = 0
+    def import_site_plus(row):
+        nonlocal structure_count
+        civ_id, cur_owner_id, site_id, structures = row
+        if site_id:
+            cursor.execute(
+                "UPDATE sites SET civ_id = ?, cur_owner_id = ? WHERE id = ?",
+                (civ_id, cur_owner_id, site_id)
+            )
 
-        # === LEGENDS.XML ===
-        print("\n--- Processing legends.xml ---")
+            # Structures
+            for (struct_list,) in structures:
+                for local_id, name, name2, struct_type in struct_list:
+                    cursor.execute(
+                        f"{insert} INTO structures (local_id, site_id, name, name2, type) VALUES (?, ?, ?, ?, ?)",
+                        (local_id, site_id, name, name2, struct_type)
+                    )
+                structure_count += len(struct_list)
+
+    # Entities
+    pos_count = assign_count = 0
+    def import_entity(row):
+        nonlocal pos_count, assign_count
+        entity_id = row[0]
+        positions, assignments = row[4:]
+        cursor.execute("INSERT OR REPLACE INTO entities (id, name, race, type) VALUES (?, ?, ?, ?)", row[:4])
+
+        # Positions
+        for pos in positions:
+            cursor.execute(
+                f"{insert} INTO entity_positions (entity_id, position_id, name) VALUES (?, ?, ?)",
+                (entity_id,) + pos
+            )
+        pos_count += len(positions)
 
-        # Regions
-        print("\nImporting regions...")
-        def import_region(data):
+        # Assignments
+        for assign in assignments:
             cursor.execute(
-                "INSERT OR REPLACE INTO regions (id, name, type) VALUES (?, ?, ?)",
-                (data.get('id'), data.get('name'), data.get('type'))
+                f"{insert} INTO entity_position_assignments (entity_id, position_id, histfig_id) VALUES (?, ?, ?)",
+                (entity_id,) + assign
             )
-        count = stream_elements(legends_clean, 'region', import_region)
-        conn.commit()
-        print(f"  Imported {count} regions.")
+        assign_count += len(assignments)
 
-        # Underground regions
-        print("\nImporting underground regions...")
-        def import_underground(data):
+    # Creatures (creature_raw section)
+    def import_creature(row):
+        if row[0]:
             cursor.execute(
-                "INSERT OR REPLACE INTO underground_regions (id, type, depth) VALUES (?, ?, ?)",
-                (data.get('id'), data.get('type'), data.get('depth'))
+                "INSERT OR REPLACE INTO creatures (creature_id, name_singular, name_plural) VALUES (?, ?, ?)",
+                row
             )
-        count = stream_elements(legends_clean, 'underground_region', import_underground)
-        conn.commit()
-        print(f"  Imported {count} underground regions.")
 
-        # Sites
-        print("\nImporting sites...")
-        def import_site(data):
+    # Rivers
+    def import_river(row):
+        cursor.execute("INSERT INTO rivers (name, path, end_pos) VALUES (?, ?, ?)", row)
+
+    # World constructions (roads, bridges, tunnels)
+    def import_world_construction(row):
+        cursor.execute("INSERT OR REPLACE INTO world_constructions (id, name, type, coords) VALUES (?, ?, ?, ?)", row)
+
+    # Relationships
+    def import_rel(row):
+        cursor.execute(
+            "INSERT OR IGNORE INTO hf_relationships (source_hf, target_hf, relationship, year) VALUES (?, ?, ?, ?)",
+            row
+        )
+
+    # Artifacts (legends_plus has more detail)
+    def update_artifact_plus(row):
+        if not merge:
+            cursor.execute(
+                """UPDATE artifacts SET
+                   item_type = COALESCE(?, item_type),
+                   item_subtype = COALESCE(?, item_subtype),
+                   mat = COALESCE(?, mat)
+                   WHERE id = ?""",
+                row[2:5] + row[:1]
+            )
+            return
+
+        # Insert artifacts that don't exist yet, otherwise fill in the details
+        cursor.execute(
+            """INSERT INTO artifacts
+               (id, name, item_type, item_subtype, mat, creator_hfid, site_id, holder_hfid)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET
+               item_type = COALESCE(excluded.item_type, item_type),
+               item_subtype = COALESCE(excluded.item_subtype, item_subtype),
+               mat = COALESCE(excluded.mat, mat),
+               creator_hfid = COALESCE(excluded.creator_hfid, creator_hfid),
+               site_id = COALESCE(excluded.site_id, site_id),
+               holder_hfid = COALESCE(excluded.holder_hfid, holder_hfid)""",
+            row
+        )
+
+    # Written content
+    style_count = ref_count = 0
+    def import_content(row):
+        nonlocal style_count, ref_count
+        content_id = row[0]
+        styles, refs = row[6:]
+        cursor.execute(
+            f"{insert} INTO written_content (id, title, type, author_hfid, page_start, page_end) VALUES (?, ?, ?, ?, ?, ?)",
+            row[:6]
+        )
+
+        # Styles
+        for style in styles:
             cursor.execute(
-                "INSERT OR REPLACE INTO sites (id, name, type, coords, rectangle) VALUES (?, ?, ?, ?, ?)",
-                (data.get('id'), data.get('name'), data.get('type'), data.get('coords'), data.get('rectangle'))
+                f"{insert} INTO written_content_styles (written_content_id, style) VALUES (?, ?)",
+                (content_id, style)
             )
-        count = stream_elements(legends_clean, 'site', import_site)
-        conn.commit()
-        print(f"  Imported {count} sites.")
+        style_count += len(styles)
 
-        # Artifacts
-        print("\nImporting artifacts...")
-        def import_artifact(data):
+        # References
+        for ref in refs:
             cursor.execute(
-                """INSERT OR REPLACE INTO artifacts
-                   (id, name, item_type, item_subtype, mat, creator_hfid, site_id, holder_hfid)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (data.get('id'), data.get('name') or data.get('name_string'),
-                 data.get('item_type'), data.get('item_subtype'), data.get('mat'),
-                 data.get('creator_hfid'), data.get('site_id'), data.get('holder_hfid'))
+                f"{insert} INTO written_content_references (written_content_id, ref_type, ref_id) VALUES (?, ?, ?)",
+                (content_id,) + ref
             )
-        count = stream_elements(legends_clean, 'artifact', import_artifact)
-        conn.commit()
-        print(f"  Imported {count} artifacts.")
-
-        # === LEGENDS_PLUS.XML (optional) ===
-        if has_plus:
-            print("\n--- Processing legends_plus.xml ---")
-
-            # Update regions with coordinates and evilness from legends_plus
-            print("\nUpdating regions with coordinates and evilness...")
-            def update_region_data(data):
-                region_id = data.get('id')
-                coords = data.get('coords')
-                evilness = data.get('evilness')
-                if region_id is not None:
-                    cursor.execute(
-                        "UPDATE regions SET coords = ?, evilness = ? WHERE id = ?",
-                        (coords, evilness, region_id)
-                    )
-            count = stream_elements(legends_plus_clean, 'region', update_region_data)
-            conn.commit()
-            print(f"  Updated {count} regions with coordinates and evilness.")
+        ref_count += len(refs)
+
+    print("\nImporting regions, sites, entities, events, artifacts and written content...")
+    counts = stream_sections(section_slice(plus_path, PLUS_SECTIONS), {
+        'region': (RecordSpec(('coords', 'evilness', 'id')), update_region_data),
+        'landmass': (RecordSpec(('id', 'name', 'coord_1', 'coord_2')), import_landmass),
+        'mountain_peak': (RecordSpec(('id', 'name', 'coords', 'height', 'is_volcano')), import_peak),
+        'site': (RecordSpec(
+            ('civ_id', 'cur_owner_id', 'id'),
+            children={'structures': RecordSpec((), children={
+                'structure': RecordSpec(('id', 'name', 'name2', 'type')),
+            })}), import_site_plus),
+        'entity': (RecordSpec(
+            ('id', 'name', 'race', 'type'),
+            children={
+                'entity_position': RecordSpec(('id', 'name')),
+                'entity_position_assignment': RecordSpec(('position_id', 'histfig')),
+            }), import_entity),
+        'creature': (RecordSpec(('creature_id', 'name_singular', 'name_plural')), import_creature),
+        'river': (RecordSpec(('name', 'path', 'end_pos')), import_river),
+        'world_construction': (RecordSpec(('id', 'name', 'type', 'coords')), import_world_construction),
+        'historical_event_relationship': (RecordSpec(('source_hf', 'target_hf', 'relationship', 'year')), import_rel),
+        'historical_event': plus_event_handler(cursor, event_years, merge),
+        'artifact': (RecordSpec(('id', 'name', 'item_type', 'item_subtype', 'mat',
+                                 'creator_hfid', 'site_id', 'holder_hfid')), update_artifact_plus),
+        'written_content': (RecordSpec(
+            ('id', 'title', 'type', 'author', 'page_start', 'page_end'),
+            children={
+                'style': None,
+                'reference': RecordSpec(('type', 'id')),
+            }), import_content),
+    }, checkpoints=checkpoints)
+    print(f"  Updated {counts['region']} regions with coordinates and evilness.")
+    print(f"  Imported {counts['landmass']} landmasses.")
+    print(f"  Imported {counts['mountain_peak']} mountain peaks.")
+    print(f"  Updated {counts['site']} sites, imported {structure_count} structures.")
+    print(f"  Imported {counts['entity']} entities, {pos_count} positions, {assign_count} assignments.")
+    print(f"  Imported {counts['creature']} creature definitions.")
+    print(f"  Imported {counts['river']} rivers.")
+    print(f"  Imported {counts['world_construction']} world constructions.")
+    print(f"  Imported {counts['historical_event_relationship']} relationships.")
+    print(f"  Imported {counts['historical_event']} historical events.")
+    print(f"  Updated {counts['artifact']} artifacts.")
+    print(f"  Imported {counts['written_content']} written content, {style_count} styles, {ref_count} references.")
+    return counts
+
+
+# Rows buffered per import writer before an executemany flush
+BATCH_SIZE = 5000
+
+# Row batches the parser may queue ahead of the writer
+PIPELINE_DEPTH = 8
+
+# Events imported between two import checkpoints (see ImportCheckpoints)
+CHECKPOINT_EVENTS = 50000
+# Failures an import resumes from: being stopped, or the disk failing it.
+# Others, like an export lxml can't parse, would only fail again.
+RESUMABLE_ERRORS = (KeyboardInterrupt, SystemExit, OSError)
+
+# Byte patterns for splitting <historical_events> into shards
+EVENT_RECORD = b'<historical_event>'
+EVENT_ID = re.compile(rb'<historical_event>\s*<id>(-?\d+)</id>')
+
+# legends_plus tables that update or reference rows created from legends.xml
+PLUS_DEFERRED_TABLES = {'regions', 'sites', 'structures', 'artifacts'}
+TABLE_PATTERN = re.compile(r'\b(?:INTO|UPDATE)\s+(\w+)')
+
+
+class BatchWriter:
+    """
+    Cursor stand-in that buffers rows per statement and writes them with
+    executemany once batch_size rows are pending. Buffers flush in the
+    order their statements were first used, so parent rows (figures,
+    entities, written content) are written before the rows referencing them.
+    Call flush() before committing.
+    """
 
-            # Landmasses
-            print("\nImporting landmasses...")
-            def import_landmass(data):
-                cursor.execute(
-                    "INSERT INTO landmasses (id, name, coord_1, coord_2) VALUES (?, ?, ?, ?)",
-                    (data.get('id'), data.get('name'), data.get('coord_1'), data.get('coord_2'))
-                )
-            count = stream_elements(legends_plus_clean, 'landmass', import_landmass)
-            conn.commit()
-            print(f"  Imported {count} landmasses.")
+    def __init__(self, cursor, batch_size=BATCH_SIZE):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.pending = 0
+
+    def execute(self, sql, params=()):
+        rows = self.buffers.get(sql)
+        if rows is None:
+            rows = self.buffers[sql] = []
+        rows.append(params)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def take(self):
+        """Return pending (sql, rows) groups in flush order and reset the buffers."""
+        batch = [(sql, rows) for sql, rows in self.buffers.items() if rows]
+        for sql in self.buffers:
+            self.buffers[sql] = []
+        self.pending = 0
+        return batch
+
+    def flush(self):
+        apply_rows(self.cursor, self.take())
+
+
+class RowBatchCursor(BatchWriter):
+    """
+    BatchWriter for import workers (processes or the pipeline parser thread).
+    Sends each batch of (sql, rows) groups to the writer instead of
+    executing it. blocked counts the seconds spent waiting for room in
+    the queue, i.e. waiting on the writer.
+    """
 
-            # Mountain peaks
-            print("\nImporting mountain peaks...")
-            def import_peak(data):
-                cursor.execute(
-                    "INSERT INTO mountain_peaks (id, name, coords, height, is_volcano) VALUES (?, ?, ?, ?, ?)",
-                    (data.get('id'), data.get('name'), data.get('coords'),
-                     data.get('height'), 1 if 'is_volcano' in data else 0)
-                )
-            count = stream_elements(legends_plus_clean, 'mountain_peak', import_peak)
-            conn.commit()
-            print(f"  Imported {count} mountain peaks.")
-
-            # Update sites + structures
-            print("\nUpdating sites and importing structures...")
-            structure_count = 0
-            def import_site_plus(data):
-                nonlocal structure_count
-                site_id = data.get('id')
-                if site_id:
-                    cursor.execute(
-                        "UPDATE sites SET civ_id = ?, cur_owner_id = ? WHERE id = ?",
-                        (data.get('civ_id'), data.get('cur_owner_id'), site_id)
-                    )
+    def __init__(self, queue, source, batch_size=BATCH_SIZE):
+        super().__init__(None, batch_size)
+        self.queue = queue
+        self.source = source
+        self.blocked = 0.0
 
-                    # Structures
-                    structures = data.get('structures', {})
-                    if isinstance(structures, dict):
-                        struct_list = structures.get('structure', [])
-                        if isinstance(struct_list, dict):
-                            struct_list = [struct_list]
-                        for struct in struct_list:
-                            if isinstance(struct, dict):
-                                cursor.execute(
-                                    "INSERT INTO structures (local_id, site_id, name, name2, type) VALUES (?, ?, ?, ?, ?)",
-                                    (struct.get('id'), site_id, struct.get('name'), struct.get('name2'), struct.get('type'))
-                                )
-                                structure_count += 1
-            count = stream_elements(legends_plus_clean, 'site', import_site_plus)
-            conn.commit()
-            print(f"  Updated {count} sites, imported {structure_count} structures.")
-
-            # Entities
-            print("\nImporting entities...")
-            pos_count = assign_count = 0
-            debug_shown = False
-            def import_entity(data):
-                nonlocal pos_count, assign_count, debug_shown
-                if not debug_shown:
-                    print(f"  DEBUG - Sample entity keys: {list(data.keys())}")
-                    debug_shown = True
-                entity_id = data.get('id')
-                cursor.execute(
-                    "INSERT OR REPLACE INTO entities (id, name, race, type) VALUES (?, ?, ?, ?)",
-                    (entity_id, data.get('name'), data.get('race'), data.get('type'))
-                )
+    def flush(self):
+        batch = self.take()
+        if batch:
+            start = time.perf_counter()
+            self.queue.put((self.source, 'rows', batch))
+            self.blocked += time.perf_counter() - start
 
-                # Positions
-                positions = data.get('entity_position', [])
-                if isinstance(positions, dict):
-                    positions = [positions]
-                for pos in positions:
-                    if isinstance(pos, dict):
-                        cursor.execute(
-                            "INSERT INTO entity_positions (entity_id, position_id, name) VALUES (?, ?, ?)",
-                            (entity_id, pos.get('id'), pos.get('name'))
-                        )
-                        pos_count += 1
-
-                # Assignments
-                assignments = data.get('entity_position_assignment', [])
-                if isinstance(assignments, dict):
-                    assignments = [assignments]
-                for assign in assignments:
-                    if isinstance(assign, dict):
-                        cursor.execute(
-                            "INSERT INTO entity_position_assignments (entity_id, position_id, histfig_id) VALUES (?, ?, ?)",
-                            (entity_id, assign.get('position_id'), assign.get('histfig'))
-                        )
-                        assign_count += 1
-            count = stream_elements(legends_plus_clean, 'entity', import_entity)
-            conn.commit()
-            print(f"  Imported {count} entities, {pos_count} positions, {assign_count} assignments.")
 
-            # Creatures (creature_raw section)
-            print("\nImporting creature definitions...")
-            def import_creature(data):
-                creature_id = data.get('creature_id')
-                if creature_id:
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO creatures (creature_id, name_singular, name_plural) VALUES (?, ?, ?)",
-                        (creature_id, data.get('name_singular'), data.get('name_plural'))
-                    )
-            count = stream_elements(legends_plus_clean, 'creature', import_creature)
-            conn.commit()
-            print(f"  Imported {count} creature definitions.")
+def statement_table(sql):
+    """Return the table an INSERT or UPDATE statement writes to."""
+    return TABLE_PATTERN.search(sql).group(1)
 
-            # Rivers
-            print("\nImporting rivers...")
-            def import_river(data):
-                cursor.execute(
-                    "INSERT INTO rivers (name, path, end_pos) VALUES (?, ?, ?)",
-                    (data.get('name'), data.get('path'), data.get('end_pos'))
-                )
-            count = stream_elements(legends_plus_clean, 'river', import_river)
-            conn.commit()
-            print(f"  Imported {count} rivers.")
 
-            # World constructions (roads, bridges, tunnels)
-            print("\nImporting world constructions...")
-            def import_world_construction(data):
-                cursor.execute(
-                    "INSERT OR REPLACE INTO world_constructions (id, name, type, coords) VALUES (?, ?, ?, ?)",
-                    (data.get('id'), data.get('name'), data.get('type'), data.get('coords'))
-                )
-            count = stream_elements(legends_plus_clean, 'world_construction', import_world_construction)
-            conn.commit()
-            print(f"  Imported {count} world constructions.")
+def apply_rows(cursor, batch):
+    """Write a batch of (sql, rows) groups, one executemany per group."""
+    for sql, rows in batch:
+        cursor.executemany(sql, rows)
+
+
+def print_utilisation(elapsed, busy):
+    """Print the share of elapsed seconds each import stage spent working."""
+    print(f"  Stage utilisation over {elapsed:.1f}s:")
+    for stage, seconds in busy.items():
+        print(f"    {stage}: {seconds / elapsed:.0%} busy, {max(elapsed - seconds, 0):.1f}s waiting")
+
+
+def import_worker(source, path, queue, batch_size):
+    """Parse one export in a worker process, sending row batches to the writer."""
+    start = time.perf_counter()
+    cursor = RowBatchCursor(queue, source, batch_size)
+    try:
+        if source == 'legends':
+            # Years go to the writer's temp table; the writer joins them at the end
+            for pair in import_legends(cursor, path, True):
+                cursor.execute("INSERT OR REPLACE INTO event_years (id, year) VALUES (?, ?)", pair)
         else:
-            print("\n--- Skipping legends_plus.xml data (file not found) ---")
-            print("  Skipped: landmasses, mountain peaks, structures, entities, creatures")
-
-        # Historical figures (from legends.xml which has names)
-        print("\nImporting historical figures from legends.xml...")
-        entity_link_count = site_link_count = hf_link_count = 0
-        def import_hf(data):
-            nonlocal entity_link_count, site_link_count, hf_link_count
-            hfid = data.get('id')
-            cursor.execute(
-                "INSERT OR REPLACE INTO historical_figures (id, name, race, caste, sex, birth_year, death_year) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (hfid, data.get('name'), data.get('race'), data.get('caste'),
-                 data.get('sex'), data.get('birth_year'), data.get('death_year'))
-            )
+            # Years are applied by the writer once legends.xml is done
+            import_legends_plus(cursor, path, {})
+        cursor.flush()
+        # Busy time: everything but waiting on the writer
+        queue.put((source, 'done', time.perf_counter() - start - cursor.blocked))
+    except Exception:
+        queue.put((source, 'error', traceback.format_exc()))
 
-            # Entity links
-            links = data.get('entity_link', [])
-            if isinstance(links, dict):
-                links = [links]
-            for link in links:
-                if isinstance(link, dict):
-                    cursor.execute(
-                        "INSERT INTO hf_entity_links (hfid, entity_id, link_type, link_strength) VALUES (?, ?, ?, ?)",
-                        (hfid, link.get('entity_id'), link.get('link_type'), link.get('link_strength'))
-                    )
-                    entity_link_count += 1
-
-            # Site links
-            slinks = data.get('site_link', [])
-            if isinstance(slinks, dict):
-                slinks = [slinks]
-            for slink in slinks:
-                if isinstance(slink, dict):
-                    cursor.execute(
-                        "INSERT INTO hf_site_links (hfid, site_id, link_type) VALUES (?, ?, ?)",
-                        (hfid, slink.get('site_id'), slink.get('link_type'))
-                    )
-                    site_link_count += 1
-
-            # HF links (family relationships: child, spouse, etc.)
-            hflinks = data.get('hf_link', [])
-            if isinstance(hflinks, dict):
-                hflinks = [hflinks]
-            for hflink in hflinks:
-                if isinstance(hflink, dict):
-                    target_hfid = hflink.get('hfid')
-                    link_type = hflink.get('link_type', '').replace(' ', '_')
-                    if target_hfid and link_type:
-                        cursor.execute(
-                            "INSERT OR IGNORE INTO hf_relationships (source_hf, target_hf, relationship, year) VALUES (?, ?, ?, ?)",
-                            (hfid, target_hfid, link_type, None)
-                        )
-                        hf_link_count += 1
-        count = stream_elements(legends_clean, 'historical_figure', import_hf)
-        conn.commit()
-        print(f"  Imported {count} historical figures, {entity_link_count} entity links, {site_link_count} site links, {hf_link_count} family links.")
 
-        # Relationships (legends_plus only)
-        if has_plus:
-            print("\nImporting relationships...")
-            def import_rel(data):
-                cursor.execute(
-                    "INSERT OR IGNORE INTO hf_relationships (source_hf, target_hf, relationship, year) VALUES (?, ?, ?, ?)",
-                    (data.get('source_hf'), data.get('target_hf'), data.get('relationship'), data.get('year'))
-                )
-            count = stream_elements(legends_plus_clean, 'historical_event_relationship', import_rel)
+def import_parallel(cursor, legends_path, plus_path, batch_size=BATCH_SIZE):
+    """
+    Parse legends.xml and legends_plus.xml in two worker processes while
+    this process applies their row batches as the single SQLite writer.
+
+    legends_plus rows for tables filled from legends.xml are held back until
+    legends.xml is done, and event years are applied once both are done.
+    """
+    cursor.execute("CREATE TEMP TABLE event_years (id INTEGER PRIMARY KEY, year INTEGER)")
+
+    queue = multiprocessing.Queue(maxsize=16)
+    workers = {
+        source: multiprocessing.Process(target=import_worker, args=(source, path, queue, batch_size))
+        for source, path in (('legends', legends_path), ('plus', plus_path))
+    }
+    # Forked workers would otherwise repeat our buffered output
+    sys.stdout.flush()
+    for worker in workers.values():
+        worker.start()
+
+    pending = set(workers)
+    deferred = []
+    row_count = 0
+    start = time.perf_counter()
+    busy = {f"{source} parser": 0.0 for source in workers}
+    busy['writer'] = 0.0
+    try:
+        while pending:
+            try:
+                source, kind, payload = queue.get(timeout=1)
+            except Empty:
+                for source in pending:
+                    if workers[source].exitcode not in (None, 0):
+                        raise RuntimeError(f"{source} worker exited with code {workers[source].exitcode}")
+                continue
+
+            if kind == 'error':
+                raise RuntimeError(f"{source} worker failed:\n{payload}")
+            write_start = time.perf_counter()
+            if kind == 'done':
+                pending.discard(source)
+                busy[f"{source} parser"] = payload
+                if source == 'legends':
+                    apply_rows(cursor, deferred)
+                    row_count += sum(len(rows) for _, rows in deferred)
+                    deferred = None
+                busy['writer'] += time.perf_counter() - write_start
+                continue
+
+            if source == 'plus' and deferred is not None:
+                ready = []
+                for group in payload:
+                    if statement_table(group[0]) in PLUS_DEFERRED_TABLES:
+                        deferred.append(group)
+                    else:
+                        ready.append(group)
+                payload = ready
+            apply_rows(cursor, payload)
+            row_count += sum(len(rows) for _, rows in payload)
+            busy['writer'] += time.perf_counter() - write_start
+    finally:
+        for worker in workers.values():
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+    print(f"  Wrote {row_count} rows from worker processes.")
+    print_utilisation(time.perf_counter() - start, busy)
+
+    print("\nApplying event years...")
+    PROGRESS.step("Applying event years")
+    cursor.execute("""
+        UPDATE historical_events SET year = (
+            SELECT year FROM event_years WHERE event_years.id = historical_events.id
+        )
+    """)
+    cursor.execute("DROP TABLE event_years")
+
+
+class ImportCheckpoints:
+    """
+    Checkpoints of one pass of an import over an export ('legends' or
+    'legends_plus'), kept in the world's import_checkpoints table so an
+    interrupted import resumes where it stopped.
+
+    iter_records reports the pass's progress. A checkpoint is saved, with
+    the rows written so far, each time a section is finished and every
+    CHECKPOINT_EVENTS events inside historical_events. On resume, the
+    sections and events up to the last checkpoint are skipped.
+
+    Once a pass stops saving (see import_exports), its progress is only
+    committed by the other pass's checkpoints.
+
+    on_events, if set, is called as the pass starts its historical_events
+    section, once everything before it has been committed.
+    """
+
+    def __init__(self, name, state, writer, commit):
+        self.name = name
+        self.sections = list(state['sections'])
+        self.last_event_id = state['last_event_id']
+        self.complete = state['complete']
+        # Events up to this id were imported before
+        self.skip_events_to = self.last_event_id
+        self.writer = writer
+        self.commit = commit
+        self.saving = True
+        self.events = 0
+        self.on_events = None
+
+    def start_section(self, section):
+        """Called as a section starts; returns True if it was imported before."""
+        if section == 'historical_events' and self.on_events is not None:
+            self.commit()
+            self.on_events()
+        return section in self.sections
+
+    def skip_record(self, tag, record):
+        """Whether a record was imported before (an event up to skip_events_to)."""
+        return (tag == 'historical_event' and self.skip_events_to is not None
+                and record[0] is not None and int(record[0]) <= self.skip_events_to)
+
+    def record_done(self, tag, record):
+        if tag != 'historical_event' or not self.saving or record[0] is None:
+            return
+        self.last_event_id = int(record[0])
+        self.events += 1
+        if self.events % CHECKPOINT_EVENTS == 0:
+            self.save()
+
+    def section_done(self, section):
+        if self.saving:
+            self.sections.append(section)
+            self.save()
+
+    def finish(self):
+        if self.saving:
+            self.complete = True
+            self.save()
+
+    def save(self):
+        """Commit the rows written so far along with this pass's position."""
+        self.writer.execute(
+            "UPDATE import_checkpoints SET sections = ?, last_event_id = ?, complete = ? WHERE pass = ?",
+            (json.dumps(self.sections), self.last_event_id, 1 if self.complete else 0, self.name)
+        )
+        self.commit()
+
+
+def start_checkpoints(cursor, has_plus, export_hash):
+    """Add the import_checkpoints rows of a new import's passes, none done yet."""
+    for name in ('legends', 'legends_plus') if has_plus else ('legends',):
+        cursor.execute(
+            "INSERT INTO import_checkpoints (pass, content_hash, sections) VALUES (?, ?, '[]')",
+            (name, export_hash)
+        )
+
+
+def read_checkpoints(conn):
+    """Saved import checkpoints of a world database by pass, or {} if it has none."""
+    rows = conn.execute("SELECT pass, sections, last_event_id, complete FROM import_checkpoints")
+    return {
+        name: {'sections': json.loads(sections), 'last_event_id': last_event_id, 'complete': bool(complete)}
+        for name, sections, last_event_id, complete in rows
+    }
+
+
+def resume_slice(path, sections, checkpoints):
+    """
+    Return a FileSlice of an export without what checkpoints says was
+    imported before: its finished sections, and events up to the last
+    checkpoint. Exports that can't be indexed are returned unchanged, and
+    iter_records skips those records as it reads them instead.
+    """
+    if checkpoints.skip_events_to is not None:
+        path = events_after(path, checkpoints.skip_events_to + 1)
+    return section_slice(path, [section for section in sections if section not in checkpoints.sections])
+
+
+def import_exports(writer, legends_path, plus_path, checkpoint, checkpoints=None, on_core=None):
+    """
+    Run the legends.xml pass and, if given, the legends_plus.xml pass
+    merge-joined with it. checkpoint() is called once everything up to
+    a consistent point has been written to writer, to flush and commit.
+
+    With checkpoints, the saved state of each pass (see read_checkpoints),
+    checkpoints are saved as the passes go, and whatever a previous,
+    interrupted attempt saved is skipped. on_core() is then called once
+    the core sections (regions, sites, artifacts, figures and entities)
+    are committed, as the pass importing events reaches them.
+    """
+    legends_checkpoints = plus_checkpoints = None
+    if checkpoints is not None:
+        legends_checkpoints = ImportCheckpoints('legends', checkpoints['legends'], writer, checkpoint)
+        if plus_path is not None:
+            plus_checkpoints = ImportCheckpoints('legends_plus', checkpoints['legends_plus'], writer, checkpoint)
+            # legends.xml events are only needed for the years of those legends_plus hasn't imported
+            legends_checkpoints.skip_events_to = plus_checkpoints.last_event_id
+        if (plus_checkpoints or legends_checkpoints).complete:
+            print("\n--- Exports already imported before the interruption ---")
+            return
+        # Events, relationships and written content all come after the core sections
+        (plus_checkpoints or legends_checkpoints).on_events = on_core
+        legends_path = resume_slice(legends_path, LEGENDS_SECTIONS, legends_checkpoints)
+        if plus_path is not None:
+            plus_path = resume_slice(plus_path, PLUS_SECTIONS, plus_checkpoints)
+
+    # === LEGENDS.XML ===
+    print("\n--- Processing legends.xml ---")
+    legends = import_legends(writer, legends_path, plus_path is not None, legends_checkpoints)
+
+    # === LEGENDS_PLUS.XML (optional) ===
+    if plus_path is not None:
+        # Runs legends.xml up to its events, which are then read
+        # alongside the legends_plus ones for their years
+        event_years = EventYearJoin(legends)
+        if legends_checkpoints is not None:
+            # The rest of the legends.xml pass runs interleaved with
+            # legends_plus, whose checkpoints cover both
+            legends_checkpoints.saving = False
+        checkpoint()
+
+        print("\n--- Processing legends_plus.xml ---")
+        import_legends_plus(writer, plus_path, event_years, checkpoints=plus_checkpoints)
+        event_years.finish()
+        checkpoint()
+        print(f"  Joined years for {event_years.matched} events, {event_years.missing} without a year")
+    else:
+        for _ in legends:
+            pass
+        checkpoint()
+
+        print("\n--- Skipping legends_plus.xml data (file not found) ---")
+        print("  Skipped: landmasses, mountain peaks, structures, entities, creatures")
+
+
+def import_pipelined(conn, legends_path, plus_path, batch_size=BATCH_SIZE, checkpoints=None, on_core=None):
+    """
+    Parse the exports in a thread while this thread writes their row
+    batches to SQLite, so parsing and database writes overlap.
+
+    The bounded queue between them keeps at most PIPELINE_DEPTH batches
+    in memory: a parser that gets ahead blocks until the writer catches up.
+    checkpoints and on_core are passed on to import_exports; on_core runs
+    in this thread, after the commit before it.
+    """
+    queue = Queue(maxsize=PIPELINE_DEPTH)
+    writer = RowBatchCursor(queue, 'parser', batch_size)
+
+    def checkpoint():
+        writer.flush()
+        queue.put(('parser', 'commit', None))
+
+    def core_done():
+        queue.put(('parser', 'call', on_core))
+
+    def parse():
+        start = time.perf_counter()
+        try:
+            import_exports(writer, legends_path, plus_path, checkpoint, checkpoints,
+                           core_done if on_core else None)
+            queue.put(('parser', 'done', time.perf_counter() - start - writer.blocked))
+        except BaseException:
+            queue.put(('parser', 'error', traceback.format_exc()))
+
+    # Daemon, so a failed write doesn't leave the process waiting on a parser
+    # blocked on the full queue
+    parser = threading.Thread(target=parse, name='import-parser', daemon=True)
+    start = time.perf_counter()
+    busy = {'parser': 0.0, 'writer': 0.0}
+    parser.start()
+    cursor = conn.cursor()
+    while True:
+        _, kind, payload = queue.get()
+        if kind == 'error':
+            raise RuntimeError(f"parser failed:\n{payload}")
+        if kind == 'done':
+            busy['parser'] = payload
+            break
+
+        write_start = time.perf_counter()
+        if kind == 'commit':
             conn.commit()
-            print(f"  Imported {count} relationships.")
-
-        # Historical events
-        print("\nImporting historical events...")
-        if has_plus:
-            # First get years from legends.xml (legends_plus doesn't have them)
-            event_years = {}
-            def collect_years(data):
-                event_id = data.get('id')
-                year = data.get('year')
-                if event_id is not None and year is not None:
-                    event_years[int(event_id)] = int(year)
-            stream_elements(legends_clean, 'historical_event', collect_years)
-            print(f"  Collected years for {len(event_years)} events from legends.xml")
-
-            # Now import full event data from legends_plus.xml with years
-            known_fields = {'id', 'year', 'type', 'site_id', 'site', 'hfid', 'civ_id', 'civ',
-                           'state', 'reason', 'slayer_hfid', 'slayer_hf', 'death_cause',
-                           'artifact_id', 'entity_id', 'structure_id'}
-            def import_event_plus(data):
-                event_id = data.get('id')
-                year = event_years.get(int(event_id)) if event_id is not None else None
-                extra = {k: v for k, v in data.items() if k not in known_fields}
-                cursor.execute(
-                    """INSERT INTO historical_events
-                       (id, year, type, site_id, hfid, civ_id, state, reason, slayer_hfid,
-                        death_cause, artifact_id, entity_id, structure_id, extra_data)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (event_id, year, data.get('type'),
-                     data.get('site_id') or data.get('site'), data.get('hfid'),
-                     data.get('civ_id') or data.get('civ'), data.get('state'), data.get('reason'),
-                     data.get('slayer_hfid') or data.get('slayer_hf'), data.get('death_cause'),
-                     data.get('artifact_id'), data.get('entity_id'), data.get('structure_id'),
-                     json.dumps(extra) if extra else None)
-                )
-            count = stream_elements(legends_plus_clean, 'historical_event', import_event_plus)
+        elif kind == 'call':
+            payload()
         else:
-            # Import events from legends.xml only (less detailed but has year)
-            basic_known_fields = {'id', 'year', 'type', 'site_id', 'hfid', 'civ_id',
-                                  'slayer_hfid', 'death_cause', 'artifact_id', 'entity_id', 'structure_id'}
-            def import_event_basic(data):
-                # Extract simple values, handling cases where field might be a dict/list
-                def safe_get(key):
-                    val = data.get(key)
-                    if isinstance(val, (dict, list)):
-                        return None
-                    return val
-
-                # Collect extra fields
-                extra = {}
-                for k, v in data.items():
-                    if k not in basic_known_fields:
-                        if isinstance(v, (str, int, float)) or v is None:
-                            extra[k] = v
+            apply_rows(cursor, payload)
+        busy['writer'] += time.perf_counter() - write_start
+    parser.join()
+    print_utilisation(time.perf_counter() - start, busy)
 
-                cursor.execute(
-                    """INSERT INTO historical_events
-                       (id, year, type, site_id, hfid, civ_id, slayer_hfid,
-                        death_cause, artifact_id, entity_id, structure_id, extra_data)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (safe_get('id'), safe_get('year'), safe_get('type'),
-                     safe_get('site_id'), safe_get('hfid'), safe_get('civ_id'),
-                     safe_get('slayer_hfid'), safe_get('death_cause'),
-                     safe_get('artifact_id'), safe_get('entity_id'), safe_get('structure_id'),
-                     json.dumps(extra) if extra else None)
-                )
-            count = stream_elements(legends_clean, 'historical_event', import_event_basic)
+
+def find_event_section(path):
+    """
+    Return byte offsets (root_end, open_end, close_start, root_close) of an
+    export: the end of <df_world>, the content of <historical_events> and
+    the start of </df_world>. None if it has no events section.
+    """
+    index = load_section_index(path)
+    if index is None:
+        return None
+    for tag, start, end in index['sections']:
+        # (a self-closing <historical_events/> has no records)
+        if tag == 'historical_events' and end - start > len(b'<historical_events/>'):
+            root_start, root_close = index['root']
+            return root_start, start + len(b'<historical_events>'), end - len(b'</historical_events>'), root_close
+    return None
+
+
+def event_id_at(mm, pos, end):
+    """Return the id of the first event record at or after pos, or None past the last one."""
+    pos = mm.find(EVENT_RECORD, pos, end)
+    if pos == -1:
+        return None
+    return int(EVENT_ID.match(mm, pos).group(1))
+
+
+def find_event_offset(mm, start, end, event_id):
+    """
+    Return the offset of the first event record in [start, end) whose id
+    is at least event_id (end if there is none). Records must be in id order.
+    """
+    lo, hi = start, end
+    while lo < hi:
+        mid = (lo + hi) // 2
+        mid_id = event_id_at(mm, mid, end)
+        if mid_id is None or mid_id >= event_id:
+            hi = mid
+        else:
+            lo = mid + 1
+    pos = mm.find(EVENT_RECORD, lo, end)
+    return end if pos == -1 else pos
+
+
+def plan_event_shards(legends_path, plus_path, shards):
+    """
+    Split the <historical_events> section into at most shards parts.
+
+    The events section of the main export (legends_plus if given, else
+    legends.xml) is cut into equal byte ranges at record boundaries. With
+    legends_plus, the matching legends.xml ranges (same event ids, for the
+    years) are found by binary search, since both list events in id order.
+
+    Returns (legends_rest, plus_rest, parts): FileSlices of both exports
+    without their events, and a (legends_slice, plus_slice) pair per shard.
+    Returns None if an export has no events section.
+    """
+    paths = [path for path in (legends_path, plus_path) if path is not None]
+    sections = [find_event_section(path) for path in paths]
+    if None in sections:
+        return None
+
+    with open(paths[-1], 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        _, start, end, _ = sections[-1]
+        cuts = [start]
+        for i in range(1, shards):
+            pos = mm.find(EVENT_RECORD, max(cuts[-1] + 1, start + (end - start) * i // shards), end)
+            if pos == -1:
+                break
+            cuts.append(pos)
+        cut_ids = [None] + [event_id_at(mm, pos, end) for pos in cuts[1:]]
+
+    rests, shard_ranges = [], []
+    for path, (root_end, start, end, root_close) in zip(paths, sections):
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if path is paths[-1]:
+                offsets = cuts
+            else:
+                offsets = [start] + [find_event_offset(mm, start, end, event_id) for event_id in cut_ids[1:]]
+            bounds = list(zip(offsets, offsets[1:] + [end]))
+            size = os.fstat(f.fileno()).st_size
+
+        # Everything but the event records, so the rest of the import sees an empty section
+        rests.append(FileSlice(path, [(0, start), (end, size)]))
+        # Each shard keeps the declaration, root and section tags around its records
+        shard_ranges.append([
+            FileSlice(path, [(0, root_end), (start - len(b'<historical_events>'), start),
+                             (shard_start, shard_end), (end, end + len(b'</historical_events>')),
+                             (root_close, size)],
+                      f"{Path(path).name} events {i + 1}/{len(bounds)}")
+            for i, (shard_start, shard_end) in enumerate(bounds)
+        ])
+
+    if plus_path is None:
+        return rests[0], None, [(legends, None) for legends in shard_ranges[0]]
+    return rests[0], rests[1], list(zip(*shard_ranges))
+
+
+def import_event_shard(legends_slice, plus_slice, staging_path, batch_size=BATCH_SIZE, compact_extra=False):
+    """
+    Import one shard of historical events into its own staging database.
+    Runs in a pool worker. Returns (events, years_matched, years_missing).
+    """
+    conn = init_world_db(staging_path, bulk=True, compact_extra=compact_extra)
+    writer = BatchWriter(conn.cursor(), batch_size)
+    if plus_slice is None:
+        counts = stream_sections(legends_slice, {'historical_event': legends_event_handler(writer)})
+        matched = missing = 0
+    else:
+        event_years = EventYearJoin(iter_event_years(legends_slice, {'historical_event': 0}))
+        counts = stream_sections(plus_slice, {'historical_event': plus_event_handler(writer, event_years)})
+        event_years.finish()
+        matched, missing = event_years.matched, event_years.missing
+    writer.flush()
+    conn.commit()
+    conn.close()
+    return counts['historical_event'], matched, missing
+
+
+def merge_event_shards(conn, staging_paths):
+    """Copy the events of each shard staging database into conn, in shard order."""
+    print("\nMerging event shards...")
+    PROGRESS.step("Merging event shards")
+    cursor = conn.cursor()
+    for staging_path in staging_paths:
         conn.commit()
-        print(f"  Imported {count} historical events.")
+        cursor.execute("ATTACH DATABASE ? AS shard", (str(staging_path),))
+        cursor.execute("INSERT INTO historical_events SELECT * FROM shard.historical_events")
+        cursor.execute("INSERT INTO event_extra SELECT * FROM shard.event_extra")
+        conn.commit()
+        cursor.execute("DETACH DATABASE shard")
+        os.unlink(staging_path)
 
-        # Update artifacts from legends_plus (has more detail)
-        if has_plus:
-            print("\nUpdating artifacts from legends_plus...")
-            def update_artifact_plus(data):
-                cursor.execute(
-                    """UPDATE artifacts SET
-                       item_type = COALESCE(?, item_type),
-                       item_subtype = COALESCE(?, item_subtype),
-                       mat = COALESCE(?, mat)
-                       WHERE id = ?""",
-                    (data.get('item_type'), data.get('item_subtype'), data.get('mat'),
-                     data.get('id'))
-                )
-            count = stream_elements(legends_plus_clean, 'artifact', update_artifact_plus)
-            conn.commit()
-            print(f"  Updated {count} artifacts.")
-
-        # Populate artifact creator/site from artifact_created events
-        print("\nPopulating artifact creators from events...")
-        cursor.execute("""
-            UPDATE artifacts SET
-                creator_hfid = (
-                    SELECT CASE
-                        WHEN json_extract(e.extra_data, '$.creator_hfid') IS NOT NULL
-                             AND json_extract(e.extra_data, '$.creator_hfid') != '-1'
-                        THEN json_extract(e.extra_data, '$.creator_hfid')
-                        ELSE e.hfid
-                    END
-                    FROM historical_events e
-                    WHERE e.type = 'artifact_created' AND e.artifact_id = artifacts.id
-                    LIMIT 1
-                ),
-                site_id = (
-                    SELECT e.site_id
-                    FROM historical_events e
-                    WHERE e.type = 'artifact_created' AND e.artifact_id = artifacts.id
-                    AND e.site_id IS NOT NULL AND e.site_id != -1
-                    LIMIT 1
-                )
-            WHERE EXISTS (
-                SELECT 1 FROM historical_events e
+
+def import_sharded(conn, plan, batch_size, import_rest, on_core=None, compact_extra=False):
+    """
+    Import the event shards of a plan_event_shards() plan in a process
+    pool, one staging database each, while import_rest(legends_path,
+    plus_path) imports the rest of the exports here. The shards are then
+    merged into conn. on_core() is called once the rest is committed,
+    before waiting for the shards.
+    """
+    legends_rest, plus_rest, parts = plan
+    print(f"\n--- Importing historical events in {len(parts)} shards ---")
+    # Forked workers would otherwise repeat our buffered output
+    sys.stdout.flush()
+    with tempfile.TemporaryDirectory(prefix='event-shards-', dir=WORLDS_DIR) as shard_dir, \
+            multiprocessing.Pool(len(parts)) as pool:
+        staging_paths = [Path(shard_dir) / f"events-{i}.db" for i in range(len(parts))]
+        pending = pool.starmap_async(import_event_shard, [
+            (legends_slice, plus_slice, staging_path, batch_size, compact_extra)
+            for (legends_slice, plus_slice), staging_path in zip(parts, staging_paths)
+        ])
+        import_rest(legends_rest, plus_rest)
+        if on_core is not None:
+            on_core()
+        results = pending.get()
+        merge_event_shards(conn, staging_paths)
+
+    print(f"  Imported {sum(events for events, _, _ in results)} historical events from {len(parts)} shards.")
+    if plus_rest is not None:
+        matched = sum(matched for _, matched, _ in results)
+        missing = sum(missing for _, _, missing in results)
+        print(f"  Joined years for {matched} events, {missing} without a year")
+
+
+# Delta imports (see update_world): tables upserted by primary key, and tables
+# of rows belonging to a record, synced per owner as (owner column, owner table).
+# Rows of tables with no owner are only ever added.
+DELTA_KEYED_TABLES = {
+    'regions': 'id', 'underground_regions': 'id', 'landmasses': 'id', 'mountain_peaks': 'id',
+    'sites': 'id', 'entities': 'id', 'creatures': 'creature_id', 'historical_figures': 'id',
+    'artifacts': 'id', 'world_constructions': 'id', 'written_content': 'id',
+}
+DELTA_OWNED_TABLES = {
+    'hf_entity_links': ('hfid', 'historical_figures'),
+    'hf_site_links': ('hfid', 'historical_figures'),
+    'hf_relationships': None,
+    'structures': ('site_id', 'sites'),
+    'entity_positions': ('entity_id', 'entities'),
+    'entity_position_assignments': ('entity_id', 'entities'),
+    'written_content_styles': ('written_content_id', 'written_content'),
+    'written_content_references': ('written_content_id', 'written_content'),
+    'rivers': None,
+}
+
+
+def find_world_to_update(name, altname, has_plus):
+    """Get the latest world with this name and altname for a delta import, or None."""
+    if not name:
+        return None
+    conn = init_master_db()
+    rows = conn.execute(
+        "SELECT * FROM worlds WHERE name = ? AND altname IS ? AND has_plus = ? AND status IS NOT 'partial'"
+        " ORDER BY created_at DESC",
+        (name, altname, 1 if has_plus else 0)
+    ).fetchall()
+    conn.close()
+    for row in rows:
+        if Path(row['db_path']).exists():
+            return dict(row)
+    return None
+
+
+def events_after(path, event_id):
+    """
+    Return a FileSlice of an export without its event records before
+    event_id, found by binary search. Returns path unchanged if it can't
+    be indexed; its older events are then skipped when syncing.
+    """
+    section = find_event_section(path)
+    if section is None:
+        return path
+    _, start, end, _ = section
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset = find_event_offset(mm, start, end, event_id)
+        return FileSlice(path, [(0, start), (offset, len(mm))])
+
+
+def sync_keyed_table(cursor, table, key):
+    """Upsert a delta table into the world, writing only new and changed rows."""
+    columns = table_columns(cursor.connection, table)
+    values = [column for column in columns if column != key]
+    column_list = ', '.join(columns)
+    cursor.execute(f"""
+        INSERT INTO main.{table} ({column_list}) SELECT {column_list} FROM delta.{table} WHERE true
+        ON CONFLICT({key}) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in values)}
+        WHERE ({', '.join(f'{table}.{c}' for c in values)}) IS NOT ({', '.join(f'excluded.{c}' for c in values)})
+    """)
+    return cursor.rowcount
+
+
+def sync_owned_table(cursor, table, owner):
+    """
+    Sync rows belonging to records (like a figure's entity links) from a
+    delta table: a record in the delta whose rows changed has them replaced
+    by the delta's, duplicates included, and the rows of other records are
+    left alone. Tables without an owner only get rows they don't have yet.
+    Returns (added, removed).
+    """
+    # Their AUTOINCREMENT ids differ between databases
+    columns = [column for column in table_columns(cursor.connection, table) if column != 'id']
+    column_list = ', '.join(columns)
+    if owner is None:
+        same_row = ' AND '.join(f"existing.{c} IS incoming.{c}" for c in columns)
+        cursor.execute(f"""
+            INSERT INTO main.{table} ({column_list})
+            SELECT {column_list} FROM delta.{table} AS incoming
+            WHERE NOT EXISTS (SELECT 1 FROM main.{table} AS existing WHERE {same_row})
+        """)
+        return cursor.rowcount, 0
+
+    owner_column, owner_table = owner
+    owners = f"SELECT {DELTA_KEYED_TABLES[owner_table]} FROM delta.{owner_table}"
+    # Rows are compared with how many times each occurs, so records whose
+    # rows only differ in duplicates count as changed too
+    incoming = f"SELECT {column_list}, COUNT(*) FROM delta.{table} GROUP BY {column_list}"
+    existing = (f"SELECT {column_list}, COUNT(*) FROM main.{table}"
+                f" WHERE {owner_column} IN ({owners}) GROUP BY {column_list}")
+    cursor.execute(f"""
+        CREATE TEMP TABLE changed_owners AS
+        SELECT DISTINCT {owner_column} AS owner FROM (
+            SELECT * FROM ({incoming} EXCEPT {existing})
+            UNION ALL
+            SELECT * FROM ({existing} EXCEPT {incoming})
+        )
+    """)
+    try:
+        cursor.execute(f"""
+            DELETE FROM main.{table} WHERE {owner_column} IN (SELECT owner FROM temp.changed_owners)
+        """)
+        removed = cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO main.{table} ({column_list})
+            SELECT {column_list} FROM delta.{table}
+            WHERE {owner_column} IN (SELECT owner FROM temp.changed_owners)
+            ORDER BY id
+        """)
+        added = cursor.rowcount
+    finally:
+        cursor.execute("DROP TABLE temp.changed_owners")
+    return added, removed
+
+
+def sync_world(conn, staging_path, last_event_id):
+    """
+    Apply a delta import in staging_path to a world database, in one
+    transaction: changed rows are updated, new rows and events after
+    last_event_id added, and rows that are unchanged left alone.
+    """
+    print("\nApplying changes...")
+    PROGRESS.step("Applying changes")
+    conn.execute("ATTACH DATABASE ? AS delta", (str(staging_path),))
+    try:
+        with conn:
+            cursor = conn.cursor()
+            columns = ', '.join(table_columns(conn, 'historical_events'))
+            cursor.execute(f"""
+                INSERT INTO main.historical_events ({columns})
+                SELECT {columns} FROM delta.historical_events WHERE id > ?
+            """, (last_event_id,))
+            print(f"  historical_events: {cursor.rowcount} added")
+            cursor.execute("""
+                INSERT INTO main.event_extra (event_id, extra_data)
+                SELECT event_id, extra_data FROM delta.event_extra WHERE event_id > ?
+            """, (last_event_id,))
+            populate_event_participants(cursor, last_event_id)
+
+            # Creators come from all of the world's events, so artifacts
+            # only count as changed if theirs did
+            populate_artifact_creators(cursor, 'delta')
+
+            for table, key in DELTA_KEYED_TABLES.items():
+                changed = sync_keyed_table(cursor, table, key)
+                if changed:
+                    print(f"  {table}: {changed} added or changed")
+            for table, owner in DELTA_OWNED_TABLES.items():
+                added, removed = sync_owned_table(cursor, table, owner)
+                if added or removed:
+                    print(f"  {table}: {added} added, {removed} removed")
+    finally:
+        conn.execute("DETACH DATABASE delta")
+
+
+def update_world(conn, legends_path, plus_path=None, batch_size=BATCH_SIZE, compact_extra=False):
+    """
+    Delta import of a later export of a world into its database (conn).
+
+    The exports are imported into a staging database, skipping events up
+    to the last one the world has: events never change once recorded. The
+    staging database is then synced into the world (see sync_world).
+    """
+    last_event_id = conn.execute("SELECT COALESCE(MAX(id), -1) FROM historical_events").fetchone()[0]
+    print(f"\nImporting changes and events after event {last_event_id}...")
+    legends_path = events_after(legends_path, last_event_id + 1)
+    if plus_path is not None:
+        plus_path = events_after(plus_path, last_event_id + 1)
+
+    with tempfile.TemporaryDirectory(prefix='delta-', dir=WORLDS_DIR) as staging_dir:
+        staging_path = Path(staging_dir) / 'delta.db'
+        staging = init_world_db(staging_path, bulk=True, compact_extra=compact_extra)
+        writer = BatchWriter(staging.cursor(), batch_size)
+        def checkpoint():
+            writer.flush()
+            staging.commit()
+        import_exports(writer, legends_path, plus_path, checkpoint)
+        # Syncing looks rows up by owner
+        build_indexes(staging)
+        staging.close()
+
+        sync_world(conn, staging_path, last_event_id)
+
+
+def populate_artifact_creators(cursor, schema='main'):
+    """
+    Fill in artifact creators and sites from artifact_created events, in the
+    artifacts table of schema (an attached database, for delta imports).
+    """
+    print("\nPopulating artifact creators from events...")
+    PROGRESS.step("Populating artifact creators")
+    cursor.execute(f"""
+        UPDATE {schema}.artifacts SET
+            creator_hfid = (
+                SELECT CASE
+                    WHEN e.creator_hfid IS NOT NULL AND e.creator_hfid != -1
+                    THEN e.creator_hfid
+                    ELSE e.hfid
+                END
+                FROM historical_events e
                 WHERE e.type = 'artifact_created' AND e.artifact_id = artifacts.id
+                LIMIT 1
+            ),
+            site_id = (
+                SELECT e.site_id
+                FROM historical_events e
+                WHERE e.type = 'artifact_created' AND e.artifact_id = artifacts.id
+                AND e.site_id IS NOT NULL AND e.site_id != -1
+                LIMIT 1
             )
-        """)
-        conn.commit()
-        print(f"  Updated {cursor.rowcount} artifacts with creator/site info.")
-
-        # Written content (legends_plus only)
-        if has_plus:
-            print("\nImporting written content...")
-            style_count = ref_count = 0
-            def import_content(data):
-                nonlocal style_count, ref_count
-                content_id = data.get('id')
-                cursor.execute(
-                    "INSERT INTO written_content (id, title, type, author_hfid, page_start, page_end) VALUES (?, ?, ?, ?, ?, ?)",
-                    (content_id, data.get('title'), data.get('type'), data.get('author'),
-                     data.get('page_start'), data.get('page_end'))
-                )
+        WHERE EXISTS (
+            SELECT 1 FROM historical_events e
+            WHERE e.type = 'artifact_created' AND e.artifact_id = artifacts.id
+        )
+    """)
+    print(f"  Updated {cursor.rowcount} artifacts with creator/site info.")
 
-                # Styles
-                styles = data.get('style', [])
-                if isinstance(styles, str):
-                    styles = [styles]
-                for style in styles:
-                    cursor.execute(
-                        "INSERT INTO written_content_styles (written_content_id, style) VALUES (?, ?)",
-                        (content_id, style)
-                    )
-                    style_count += 1
-
-                # References
-                refs = data.get('reference', [])
-                if isinstance(refs, dict):
-                    refs = [refs]
-                for ref in refs:
-                    if isinstance(ref, dict):
-                        cursor.execute(
-                            "INSERT INTO written_content_references (written_content_id, ref_type, ref_id) VALUES (?, ?, ?)",
-                            (content_id, ref.get('type'), ref.get('id'))
-                        )
-                        ref_count += 1
-            count = stream_elements(legends_plus_clean, 'written_content', import_content)
+
+def populate_event_participants(cursor, after_event_id=None):
+    """
+    Fill event_participants with every figure each event names: the hfid
+    and slayer_hfid columns, and the EVENT_FIGURE_KEYS and '*_hfid' fields
+    of extra_data (top-level text, or lists of it). Ids below 0 mean none.
+
+    Rebuilds the whole table, or with after_event_id, adds the events
+    after it (those a delta import added).
+    """
+    print("\nPopulating event participants...")
+    PROGRESS.step("Populating event participants")
+    after_event_id = -1 if after_event_id is None else after_event_id
+    cursor.execute("DELETE FROM event_participants WHERE event_id > ?", (after_event_id,))
+    keys = ', '.join(f"'{key}'" for key in EVENT_FIGURE_KEYS)
+    # A list field is joined to its items; other fields to nothing
+    cursor.execute(f"""
+        INSERT INTO event_participants (event_id, hfid, year, role)
+        SELECT id, hfid, year, 'hfid' FROM historical_events
+        WHERE id > :after AND hfid >= 0
+        UNION ALL
+        SELECT id, slayer_hfid, year, 'slayer_hfid' FROM historical_events
+        WHERE id > :after AND slayer_hfid >= 0
+        UNION ALL
+        SELECT id, CAST(value AS INTEGER), year, role FROM (
+            SELECT e.id, e.year, field.key AS role,
+                   CASE WHEN field.type = 'array' THEN item.value ELSE field.value END AS value,
+                   CASE WHEN field.type = 'array' THEN item.type ELSE field.type END AS type
+            FROM event_extra x JOIN historical_events e ON e.id = x.event_id,
+                 json_each(extra_json(x.extra_data)) field
+            LEFT JOIN json_each(CASE WHEN field.type = 'array' THEN field.value END) item
+            WHERE x.event_id > :after AND x.extra_data IS NOT NULL
+              AND (field.key IN ({keys}) OR field.key GLOB '*_hfid')
+        )
+        WHERE type = 'text' AND CAST(CAST(value AS INTEGER) AS TEXT) = value AND CAST(value AS INTEGER) >= 0
+    """, {'after': after_event_id})
+    print(f"  Added {cursor.rowcount} event participants.")
+
+
+def load_world(conn, name, altname, legends_path, plus_path=None,
+               parallel=False, batch_size=BATCH_SIZE, bulk=False, pipeline=False, shards=0,
+               export_hash=None, on_core=None, compact_extra=False):
+    """
+    Import legends (and optional legends_plus) data into a new world database.
+    With shards > 1, historical events are imported by a process pool.
+
+    Single-pass imports (not parallel or sharded) save checkpoints tagged
+    with export_hash as they go. If conn has checkpoints, the import it had
+    is resumed from them instead, in a single pass.
+
+    on_core() is called once regions, sites, artifacts, figures and
+    entities are committed, while events and written content are still to
+    come. Parallel imports without shards never call it, as they finish
+    all sections together.
+    """
+    has_plus = plus_path is not None
+    cursor = conn.cursor()
+
+    checkpoints = read_checkpoints(conn)
+    if checkpoints:
+        print("\nResuming from the last checkpoint:")
+        for pass_name, state in checkpoints.items():
+            done = ', '.join(state['sections']) or 'no sections'
+            if state['last_event_id'] is not None:
+                done += f", events up to {state['last_event_id']}"
+            print(f"  {pass_name}: {'complete' if state['complete'] else done}")
+        parallel, shards = False, 0
+    else:
+        # Insert world info (use fallback if no name from vanilla legends.xml)
+        cursor.execute("INSERT INTO world (name, altname) VALUES (?, ?)", (name or "Unknown World", altname))
+
+    plan = plan_event_shards(legends_path, plus_path, shards) if shards > 1 else None
+    if shards > 1 and plan is None:
+        print("\nExports can't be split into shards (compressed, still uploading, or no events); importing events in one pass.")
+    if not checkpoints and plan is None and not (parallel and has_plus):
+        start_checkpoints(cursor, has_plus, export_hash)
+        checkpoints = read_checkpoints(conn)
+    conn.commit()
+
+    def import_all(legends_path, plus_path):
+        if parallel and has_plus:
+            print("\n--- Processing legends.xml and legends_plus.xml in parallel ---")
+            import_parallel(cursor, legends_path, plus_path, batch_size)
             conn.commit()
-            print(f"  Imported {count} written content, {style_count} styles, {ref_count} references.")
+        elif pipeline:
+            import_pipelined(conn, legends_path, plus_path, batch_size, checkpoints or None,
+                             None if plan else on_core)
+        else:
+            writer = BatchWriter(cursor, batch_size)
+            def checkpoint():
+                writer.flush()
+                conn.commit()
+            import_exports(writer, legends_path, plus_path, checkpoint, checkpoints or None,
+                           None if plan else on_core)
+
+    if plan is None:
+        import_all(legends_path, plus_path)
+    else:
+        import_sharded(conn, plan, batch_size, import_all, on_core, compact_extra)
 
-        conn.close()
+    populate_event_participants(cursor)
+    if bulk:
+        build_indexes(conn)
 
-        # Register world in master database
-        print("\nRegistering world...")
-        register_world(name, altname, db_path, has_plus=has_plus)
+    populate_artifact_creators(cursor)
+    conn.commit()
+
+
+def run_import(legends_path=None, plus_path=None, parallel=False, batch_size=BATCH_SIZE,
+               bulk=False, pipeline=False, shards=0, job_id=None, cache=True, clone=False,
+               update=False, compact_extra=False):
+    """
+    Main import function. job_id is the background job running it, if any.
+
+    With cache, exports identical to those of an existing world aren't
+    imported again: that world is made current instead, or with clone,
+    copied to a new world. With update, a later export of an existing world
+    (same name and altname) is applied to it as a delta import. With
+    compact_extra, events store extra_data compact (see extra_data.py).
+    """
+    print("=" * 50)
+    print("DF Tales XML Import")
+    print("=" * 50)
+
+    # Find XML files
+    exports = find_xml_files(legends_path, plus_path)
+    if exports is None:
+        print("\nERROR: Could not find XML files!")
+        print("Please place your legends XML file in:", BASE_DIR)
+        print("Expected: *legends.xml (required), raw, .gz, .bz2, .xz or in a .zip")
+        print("Optional: *legends_plus.xml (DFHack export for additional data)")
+        return False
+
+    legends_file, plus_file = exports
+    has_plus = plus_file is not None
+
+    print(f"\nUsing XML files:")
+    print(f"  Legends: {legends_file}")
+    if has_plus:
+        print(f"  Legends+: {plus_file}")
+    else:
+        print("  Legends+: Not provided (some features will be limited)")
+
+    # Exports still being uploaded, compressed or not, are hashed once the
+    # import has read them, so the upload and the import can overlap. Zip
+    # archives are only imported once complete.
+    uploading = any(path is not None and not isinstance(path, ZipMember) and upload_marker(path).exists()
+                    for path in (legends_file, plus_file))
+    export_hash = None if uploading else content_hash(legends_file, plus_file)
+    if cache and export_hash:
+        print("\nChecking import cache...")
+        cached = find_cached_world(export_hash, compact_extra)
+        if cached:
+            return reuse_world(cached, clone, job_id)
+        print("  No world imported from these exports yet.")
+
+    # First, get world info to determine database name
+    print("\nReading world info...")
+    if has_plus:
+        name, altname = get_world_info(plus_file)
+    else:
+        name, altname = get_world_info_from_legends(legends_file)
+    print(f"  World: {name}" + (f" ({altname})" if altname else ""))
+
+    if update:
+        world = find_world_to_update(name, altname, has_plus)
+        if world:
+            return run_update(world, legends_file, plus_file, export_hash, batch_size, job_id, compact_extra)
+        if not name:
+            print("  The exports don't name the world (legends_plus.xml does), importing it as a new world.")
+        else:
+            print("  No world with this name to update, importing it as a new world.")
+
+    # An interrupted import of the same exports resumes from its checkpoints
+    interrupted = find_interrupted_import(export_hash) if export_hash else None
+    if interrupted:
+        path, lock = interrupted
+        # Bulk loads are staged in <world id>.db.importing, and resume as one
+        bulk = path.suffix == '.importing'
+        db_path = path.with_suffix('') if bulk else path
+        print(f"\nResuming interrupted import: {db_path.name}" + (" (bulk load)" if bulk else ""))
+    else:
+        # Generate world ID and database path
+        world_id = generate_world_id(name)
+        db_path = WORLDS_DIR / f"{world_id}.db"
+        lock = None
+        print(f"\nInitializing database: {db_path.name}" + (" (bulk load)" if bulk else ""))
+
+    # Initialize world database (bulk loads go to a staging file first)
+    staging_path = db_path.with_name(f"{db_path.name}.importing") if bulk else None
+    conn = init_world_db(staging_path or db_path, bulk=bulk, compact_extra=compact_extra)
+    if lock is None:
+        lock = acquire_import_lock(db_path)
+
+    # The world can be browsed as soon as its core sections are in,
+    # registered as 'partial' until the rest is imported
+    world_id = None if bulk else find_partial_world(db_path)
+
+    def register_partial():
+        nonlocal world_id
+        if world_id is not None:
+            return
+        print("\nRegistering world (events and written content still importing)...")
+        world_id = register_world(name, altname, db_path, has_plus=has_plus, status='partial')
+        if job_id:
+            record_job_world(job_id, world_id)
         print(f"  World ID: {world_id}")
-        print(f"  Has legends_plus: {'Yes' if has_plus else 'No'}")
 
-        print("\n" + "=" * 50)
-        print("Import complete!")
-        print(f"World '{name}' is now active.")
-        print("=" * 50)
-        return True
+    try:
+        try:
+            load_world(conn, name, altname, legends_file, plus_file,
+                       parallel=parallel, batch_size=batch_size, bulk=bulk, pipeline=pipeline,
+                       shards=shards, export_hash=export_hash,
+                       on_core=None if bulk else register_partial, compact_extra=compact_extra)
+            if bulk:
+                finish_bulk_load(conn, staging_path, db_path)
+            else:
+                conn.close()
+        except BaseException as e:
+            # Keep a database with checkpoints to resume from, and leave
+            # nothing else half-built behind a failed import
+            try:
+                conn.rollback()
+                resumable = (isinstance(e, RESUMABLE_ERRORS) and export_hash is not None
+                             and bool(read_checkpoints(conn)))
+            except sqlite3.Error:
+                resumable = False
+            conn.close()
+            if resumable:
+                print("\nImport interrupted. Run it again on the same exports to resume from the last checkpoint.")
+            else:
+                discard_world_db(staging_path or db_path)
+                if world_id is not None:
+                    unregister_world(world_id)
+            raise
+
+        if export_hash is None:
+            export_hash = content_hash(legends_file, plus_file)
 
+        # Register world in master database
+        if world_id is not None:
+            print("\nMarking world as complete...")
+            complete_world(world_id, export_hash)
+        else:
+            print("\nRegistering world...")
+            PROGRESS.step("Registering world")
+            world_id = register_world(name, altname, db_path, has_plus=has_plus, content_hash=export_hash)
+        if job_id:
+            record_job_world(job_id, world_id)
     finally:
-        # Cleanup temp files
-        os.unlink(legends_clean)
-        if legends_plus_clean:
-            os.unlink(legends_plus_clean)
+        if lock is not None:
+            release_import_lock(lock, db_path)
+    print(f"  World ID: {world_id}")
+    print(f"  Has legends_plus: {'Yes' if has_plus else 'No'}")
+
+    print("\n" + "=" * 50)
+    print("Import complete!")
+    print(f"World '{name}' is now active.")
+    print("=" * 50)
+    return True
 
 
-def run_merge_plus(world_id, db_path, plus_path):
+def run_update(world, legends_file, plus_file, export_hash, batch_size, job_id, compact_extra=False):
+    """Apply the exports to an existing world as a delta import (see update_world)."""
+    print(f"\nUpdating world {world['id']}: {world['db_path']}")
+    conn = sqlite3.connect(world['db_path'])
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        migrate_world_db(conn)
+        # A compact world stays compact
+        update_world(conn, legends_file, plus_file, batch_size, compact_extra or has_compact_extra(conn))
+    finally:
+        conn.close()
+
+    # The world now matches these exports
+    if export_hash is None:
+        export_hash = content_hash(legends_file, plus_file)
+    master_conn = init_master_db()
+    master_conn.execute("UPDATE worlds SET content_hash = ? WHERE id = ?", (export_hash, world['id']))
+    master_conn.commit()
+    master_conn.close()
+    set_current_world(world['id'])
+    if job_id:
+        record_job_world(job_id, world['id'])
+
+    print("\n" + "=" * 50)
+    print("Update complete!")
+    print(f"World '{world['name']}' is now active.")
+    print("=" * 50)
+    return True
+
+
+def reuse_world(world, clone, job_id):
+    """Use an existing world for exports it was imported from, or with clone, a copy of it."""
+    print(f"  Already imported as world {world['id']}: {world['name']}")
+    world_id = world['id']
+    if clone:
+        db_path = WORLDS_DIR / f"{generate_world_id(world['name'])}.db"
+        print(f"\nCloning database: {db_path.name}")
+        PROGRESS.step("Cloning world")
+        clone_world_db(world['db_path'], db_path)
+        world_id = register_world(world['name'], world['altname'], db_path,
+                                  has_plus=world['has_plus'], content_hash=world['content_hash'])
+    else:
+        set_current_world(world_id)
+    if job_id:
+        record_job_world(job_id, world_id)
+    print(f"  World ID: {world_id}")
+
+    print("\n" + "=" * 50)
+    print("Import skipped: " + ("world cloned." if clone else "existing world is now active."))
+    print("=" * 50)
+    return True
+
+
+def run_merge_plus(world_id, db_path, plus_path, batch_size=BATCH_SIZE):
     """Merge legends_plus.xml data into an existing world database."""
     print("=" * 50)
     print("DF Tales Legends Plus Merge")
@@ -769,334 +2686,296 @@ def run_merge_plus(world_id, db_path, plus_path):
     if not plus_file.exists():
         print(f"\nERROR: File not found: {plus_path}")
         return False
+    if plus_file.suffix.lower() == ARCHIVE_SUFFIX:
+        _, plus_file = find_zip_exports(plus_file)
+        if plus_file is None:
+            print(f"\nERROR: No legends_plus.xml in archive: {plus_path}")
+            return False
 
     print(f"\nMerging into world: {world_id}")
     print(f"  Database: {db_path}")
     print(f"  Legends+: {plus_file}")
 
-    # Sanitize XML file
-    print("\nSanitizing XML file...")
-    legends_plus_clean = sanitize_xml_file(plus_file)
+    # Connect to existing world database
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    migrate_world_db(conn)
+    # Merged events keep the world's extra_data encoding
+    register_extra_functions(conn, has_compact_extra(conn))
+    cursor = conn.cursor()
 
-    try:
-        # Connect to existing world database
-        conn = sqlite3.connect(db_path)
-        conn.execute("PRAGMA foreign_keys = ON")
-        cursor = conn.cursor()
+    # Get world info from legends_plus
+    print("\nReading world info...")
+    name, altname = get_world_info(plus_file)
+    print(f"  World: {name}" + (f" ({altname})" if altname else ""))
 
-        # Get world info from legends_plus
-        print("\nReading world info...")
-        name, altname = get_world_info(legends_plus_clean)
-        print(f"  World: {name}" + (f" ({altname})" if altname else ""))
+    # Update world name and altname from plus data
+    if name:
+        cursor.execute("UPDATE world SET name = ? WHERE name IS NULL OR name = '' OR name = 'Unknown World'", (name,))
+    if altname:
+        cursor.execute("UPDATE world SET altname = ? WHERE altname IS NULL", (altname,))
+    conn.commit()
 
-        # Update world name and altname from plus data
-        if name:
-            cursor.execute("UPDATE world SET name = ? WHERE name IS NULL OR name = '' OR name = 'Unknown World'", (name,))
-        if altname:
-            cursor.execute("UPDATE world SET altname = ? WHERE altname IS NULL", (altname,))
-        conn.commit()
+    print("\n--- Processing legends_plus.xml ---")
 
-        print("\n--- Processing legends_plus.xml ---")
+    # Existing events keep their years; legends_plus doesn't have them
+    writer = BatchWriter(cursor, batch_size)
+    import_legends_plus(writer, plus_file, {}, merge=True)
+    writer.flush()
+    populate_event_participants(cursor)
+    conn.commit()
 
-        # Update regions with coordinates and evilness from legends_plus
-        print("\nUpdating regions with coordinates and evilness...")
-        def update_region_data(data):
-            region_id = data.get('id')
-            coords = data.get('coords')
-            evilness = data.get('evilness')
-            if region_id is not None:
-                cursor.execute(
-                    "UPDATE regions SET coords = ?, evilness = ? WHERE id = ?",
-                    (coords, evilness, region_id)
-                )
-        count = stream_elements(legends_plus_clean, 'region', update_region_data)
-        conn.commit()
-        print(f"  Updated {count} regions with coordinates and evilness.")
+    conn.close()
 
-        # Landmasses
-        print("\nImporting landmasses...")
-        def import_landmass(data):
-            cursor.execute(
-                "INSERT OR REPLACE INTO landmasses (id, name, coord_1, coord_2) VALUES (?, ?, ?, ?)",
-                (data.get('id'), data.get('name'), data.get('coord_1'), data.get('coord_2'))
-            )
-        count = stream_elements(legends_plus_clean, 'landmass', import_landmass)
-        conn.commit()
-        print(f"  Imported {count} landmasses.")
+    # Update master database
+    print("\nUpdating world status...")
+    update_world_has_plus(world_id)
 
-        # Mountain peaks
-        print("\nImporting mountain peaks...")
-        def import_peak(data):
-            cursor.execute(
-                "INSERT OR REPLACE INTO mountain_peaks (id, name, coords, height, is_volcano) VALUES (?, ?, ?, ?, ?)",
-                (data.get('id'), data.get('name'), data.get('coords'),
-                 data.get('height'), 1 if 'is_volcano' in data else 0)
-            )
-        count = stream_elements(legends_plus_clean, 'mountain_peak', import_peak)
-        conn.commit()
-        print(f"  Imported {count} mountain peaks.")
-
-        # Update sites + structures
-        print("\nUpdating sites and importing structures...")
-        structure_count = 0
-        def import_site_plus(data):
-            nonlocal structure_count
-            site_id = data.get('id')
-            if site_id:
-                cursor.execute(
-                    "UPDATE sites SET civ_id = ?, cur_owner_id = ? WHERE id = ?",
-                    (data.get('civ_id'), data.get('cur_owner_id'), site_id)
-                )
+    # Also update name and altname in master db
+    if name or altname:
+        master_conn = init_master_db()
+        if name:
+            master_conn.execute("UPDATE worlds SET name = ? WHERE id = ? AND (name IS NULL OR name = '' OR name = 'Unknown World')", (name, world_id))
+        if altname:
+            master_conn.execute("UPDATE worlds SET altname = ? WHERE id = ?", (altname, world_id))
+        master_conn.commit()
+        master_conn.close()
 
-                # Structures
-                structures = data.get('structures', {})
-                if isinstance(structures, dict):
-                    struct_list = structures.get('structure', [])
-                    if isinstance(struct_list, dict):
-                        struct_list = [struct_list]
-                    for struct in struct_list:
-                        if isinstance(struct, dict):
-                            cursor.execute(
-                                "INSERT OR REPLACE INTO structures (local_id, site_id, name, name2, type) VALUES (?, ?, ?, ?, ?)",
-                                (struct.get('id'), site_id, struct.get('name'), struct.get('name2'), struct.get('type'))
-                            )
-                            structure_count += 1
-        count = stream_elements(legends_plus_clean, 'site', import_site_plus)
-        conn.commit()
-        print(f"  Updated {count} sites, imported {structure_count} structures.")
-
-        # Entities
-        print("\nImporting entities...")
-        pos_count = assign_count = 0
-        def import_entity(data):
-            nonlocal pos_count, assign_count
-            entity_id = data.get('id')
-            cursor.execute(
-                "INSERT OR REPLACE INTO entities (id, name, race, type) VALUES (?, ?, ?, ?)",
-                (entity_id, data.get('name'), data.get('race'), data.get('type'))
-            )
+    print("\n" + "=" * 50)
+    print("Merge complete!")
+    print(f"World '{world_id}' now has legends_plus data.")
+    print("=" * 50)
+    return True
 
-            # Positions
-            positions = data.get('entity_position', [])
-            if isinstance(positions, dict):
-                positions = [positions]
-            for pos in positions:
-                if isinstance(pos, dict):
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO entity_positions (entity_id, position_id, name) VALUES (?, ?, ?)",
-                        (entity_id, pos.get('id'), pos.get('name'))
-                    )
-                    pos_count += 1
-
-            # Assignments
-            assignments = data.get('entity_position_assignment', [])
-            if isinstance(assignments, dict):
-                assignments = [assignments]
-            for assign in assignments:
-                if isinstance(assign, dict):
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO entity_position_assignments (entity_id, position_id, histfig_id) VALUES (?, ?, ?)",
-                        (entity_id, assign.get('position_id'), assign.get('histfig'))
-                    )
-                    assign_count += 1
-        count = stream_elements(legends_plus_clean, 'entity', import_entity)
-        conn.commit()
-        print(f"  Imported {count} entities, {pos_count} positions, {assign_count} assignments.")
 
-        # Creatures (creature_raw section)
-        print("\nImporting creature definitions...")
-        def import_creature(data):
-            creature_id = data.get('creature_id')
-            if creature_id:
-                cursor.execute(
-                    "INSERT OR REPLACE INTO creatures (creature_id, name_singular, name_plural) VALUES (?, ?, ?)",
-                    (creature_id, data.get('name_singular'), data.get('name_plural'))
-                )
-        count = stream_elements(legends_plus_clean, 'creature', import_creature)
-        conn.commit()
-        print(f"  Imported {count} creature definitions.")
+def run_migrate(world_id=None):
+    """
+    Migrate every registered world database, or just the world with this
+    id, to the current schema (see migrate_world_db).
+    """
+    conn = init_master_db()
+    worlds = conn.execute("SELECT id, name, db_path FROM worlds WHERE ? IS NULL OR id = ? ORDER BY created_at",
+                          (world_id, world_id)).fetchall()
+    conn.close()
+    for world in worlds:
+        if not Path(world['db_path']).exists():
+            continue
+        print(f"World {world['id']} ({world['name']}): {world['db_path']}")
+        world_conn = sqlite3.connect(world['db_path'], timeout=30)
+        try:
+            migrated = migrate_world_db(world_conn)
+        finally:
+            world_conn.close()
+        print("  Migrated." if migrated else "  Already up to date.")
+    return True
 
-        # Rivers
-        print("\nImporting rivers...")
-        def import_river(data):
-            cursor.execute(
-                "INSERT INTO rivers (name, path, end_pos) VALUES (?, ?, ?)",
-                (data.get('name'), data.get('path'), data.get('end_pos'))
-            )
-        count = stream_elements(legends_plus_clean, 'river', import_river)
-        conn.commit()
-        print(f"  Imported {count} rivers.")
 
-        # World constructions (roads, bridges, tunnels)
-        print("\nImporting world constructions...")
-        def import_world_construction(data):
-            cursor.execute(
-                "INSERT OR REPLACE INTO world_constructions (id, name, type, coords) VALUES (?, ?, ?, ?)",
-                (data.get('id'), data.get('name'), data.get('type'), data.get('coords'))
-            )
-        count = stream_elements(legends_plus_clean, 'world_construction', import_world_construction)
-        conn.commit()
-        print(f"  Imported {count} world constructions.")
+# Imports a batch runs at once (see run_batch), each writing its own world database
+BATCH_WORKERS = min(4, os.cpu_count() or 1)
 
-        # Relationships
-        print("\nImporting relationships...")
-        def import_rel(data):
-            cursor.execute(
-                "INSERT OR IGNORE INTO hf_relationships (source_hf, target_hf, relationship, year) VALUES (?, ?, ?, ?)",
-                (data.get('source_hf'), data.get('target_hf'), data.get('relationship'), data.get('year'))
-            )
-        count = stream_elements(legends_plus_clean, 'historical_event_relationship', import_rel)
-        conn.commit()
-        print(f"  Imported {count} relationships.")
-
-        # Update historical events with more detailed data
-        print("\nUpdating historical events...")
-        # First get existing years from the database
-        event_years = {}
-        for row in cursor.execute("SELECT id, year FROM historical_events WHERE year IS NOT NULL"):
-            event_years[int(row[0])] = int(row[1])
-        print(f"  Found years for {len(event_years)} existing events")
-
-        known_fields = {'id', 'year', 'type', 'site_id', 'site', 'hfid', 'civ_id', 'civ',
-                       'state', 'reason', 'slayer_hfid', 'slayer_hf', 'death_cause',
-                       'artifact_id', 'entity_id', 'structure_id'}
-        def import_event_plus(data):
-            event_id = data.get('id')
-            year = event_years.get(int(event_id)) if event_id is not None else None
-            extra = {k: v for k, v in data.items() if k not in known_fields}
-            cursor.execute(
-                """INSERT OR REPLACE INTO historical_events
-                   (id, year, type, site_id, hfid, civ_id, state, reason, slayer_hfid,
-                    death_cause, artifact_id, entity_id, structure_id, extra_data)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (event_id, year, data.get('type'),
-                 data.get('site_id') or data.get('site'), data.get('hfid'),
-                 data.get('civ_id') or data.get('civ'), data.get('state'), data.get('reason'),
-                 data.get('slayer_hfid') or data.get('slayer_hf'), data.get('death_cause'),
-                 data.get('artifact_id'), data.get('entity_id'), data.get('structure_id'),
-                 json.dumps(extra) if extra else None)
-            )
-        count = stream_elements(legends_plus_clean, 'historical_event', import_event_plus)
-        conn.commit()
-        print(f"  Updated {count} historical events.")
-
-        # Artifacts
-        print("\nUpdating artifacts...")
-        debug_shown = False
-        def import_artifact_plus(data):
-            nonlocal debug_shown
-            if not debug_shown:
-                print(f"  DEBUG - Sample artifact keys: {list(data.keys())}")
-                debug_shown = True
-            cursor.execute(
-                """UPDATE artifacts SET
-                   item_type = COALESCE(?, item_type),
-                   item_subtype = COALESCE(?, item_subtype),
-                   mat = COALESCE(?, mat),
-                   creator_hfid = COALESCE(?, creator_hfid),
-                   site_id = COALESCE(?, site_id),
-                   holder_hfid = COALESCE(?, holder_hfid)
-                   WHERE id = ?""",
-                (data.get('item_type'), data.get('item_subtype'), data.get('mat'),
-                 data.get('creator_hfid'), data.get('site_id'), data.get('holder_hfid'),
-                 data.get('id'))
-            )
-            # If artifact doesn't exist yet, insert it
-            if cursor.rowcount == 0:
-                cursor.execute(
-                    """INSERT INTO artifacts
-                       (id, name, item_type, item_subtype, mat, creator_hfid, site_id, holder_hfid)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (data.get('id'), data.get('name'),
-                     data.get('item_type'), data.get('item_subtype'), data.get('mat'),
-                     data.get('creator_hfid'), data.get('site_id'), data.get('holder_hfid'))
-                )
-        count = stream_elements(legends_plus_clean, 'artifact', import_artifact_plus)
-        conn.commit()
-        print(f"  Updated {count} artifacts.")
-
-        # Written content
-        print("\nImporting written content...")
-        style_count = ref_count = 0
-        def import_content(data):
-            nonlocal style_count, ref_count
-            content_id = data.get('id')
-            cursor.execute(
-                "INSERT OR REPLACE INTO written_content (id, title, type, author_hfid, page_start, page_end) VALUES (?, ?, ?, ?, ?, ?)",
-                (content_id, data.get('title'), data.get('type'), data.get('author'),
-                 data.get('page_start'), data.get('page_end'))
-            )
 
-            # Styles
-            styles = data.get('style', [])
-            if isinstance(styles, str):
-                styles = [styles]
-            for style in styles:
-                cursor.execute(
-                    "INSERT OR REPLACE INTO written_content_styles (written_content_id, style) VALUES (?, ?)",
-                    (content_id, style)
-                )
-                style_count += 1
-
-            # References
-            refs = data.get('reference', [])
-            if isinstance(refs, dict):
-                refs = [refs]
-            for ref in refs:
-                if isinstance(ref, dict):
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO written_content_references (written_content_id, ref_type, ref_id) VALUES (?, ?, ?)",
-                        (content_id, ref.get('type'), ref.get('id'))
-                    )
-                    ref_count += 1
-        count = stream_elements(legends_plus_clean, 'written_content', import_content)
-        conn.commit()
-        print(f"  Imported {count} written content, {style_count} styles, {ref_count} references.")
+def find_batch_exports(directory):
+    """
+    Pair up the exports in a directory and its subdirectories by world.
+    Dwarf Fortress names both exports of a world after its region and date
+    (region1-00250-01-01-legends.xml and -legends_plus.xml), so they pair
+    on what comes before "legends". Either may be compressed, and a .zip
+    is one world on its own.
+
+    Returns (pairs, unpaired): (legends, legends_plus) paths, legends_plus
+    None if there is none, and legends_plus exports without a legends.xml.
+    """
+    worlds = {}
+    patterns = EXPORT_PATTERNS + (f'*{ARCHIVE_SUFFIX}',)
+    for path in sorted(f for pattern in patterns for f in Path(directory).rglob(pattern)):
+        name = path.name.lower()
+        if path.suffix.lower() == ARCHIVE_SUFFIX:
+            # find_xml_files takes the legends_plus export from the archive
+            key, field = (path.parent, name), 'legends'
+        elif "legends_plus" in name:
+            key, field = (path.parent, name[:name.index("legends_plus")]), 'legends_plus'
+        elif "legends" in name:
+            key, field = (path.parent, name[:name.index("legends")]), 'legends'
+        else:
+            continue
+        # An export found both raw and compressed is imported from the raw file
+        worlds.setdefault(key, {}).setdefault(field, path)
 
-        conn.close()
+    pairs = [(world['legends'], world.get('legends_plus')) for world in worlds.values() if 'legends' in world]
+    unpaired = [world['legends_plus'] for world in worlds.values() if 'legends' not in world]
+    return pairs, unpaired
 
-        # Update master database
-        print("\nUpdating world status...")
-        update_world_has_plus(world_id)
-
-        # Also update name and altname in master db
-        if name or altname:
-            master_conn = init_master_db()
-            if name:
-                master_conn.execute("UPDATE worlds SET name = ? WHERE id = ? AND (name IS NULL OR name = '' OR name = 'Unknown World')", (name, world_id))
-            if altname:
-                master_conn.execute("UPDATE worlds SET altname = ? WHERE id = ?", (altname, world_id))
-            master_conn.commit()
-            master_conn.close()
-
-        print("\n" + "=" * 50)
-        print("Merge complete!")
-        print(f"World '{world_id}' now has legends_plus data.")
-        print("=" * 50)
-        return True
 
-    finally:
-        # Cleanup temp file
-        os.unlink(legends_plus_clean)
+def import_batch_world(legends_path, plus_path, options):
+    """
+    Import one world of a batch in a pool worker (see run_batch). Returns
+    (success, output), output being everything the import printed. It is
+    written to a temporary file through the process's stdout and stderr,
+    so output of shard and parallel workers is kept too, and imports
+    running at the same time don't interleave.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with tempfile.TemporaryFile(mode='w+', encoding='utf-8', errors='replace') as output:
+        os.dup2(output.fileno(), 1)
+        os.dup2(output.fileno(), 2)
+        try:
+            success = run_import(legends_path, plus_path, **options)
+        except Exception:
+            traceback.print_exc()
+            success = False
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            for fd in saved:
+                os.close(fd)
+        output.seek(0)
+        return success, output.read()
+
+
+def run_batch(directory, workers=BATCH_WORKERS, **options):
+    """
+    Import every world exported to a directory (see find_batch_exports),
+    up to workers at a time in a process pool. options are passed on to
+    run_import. Each import's output is printed as a whole once it ends.
+    Returns True if all of them succeeded.
+    """
+    print("=" * 50)
+    print("DF Tales Batch Import")
+    print("=" * 50)
 
+    pairs, unpaired = find_batch_exports(directory)
+    for path in unpaired:
+        print(f"  Skipping {path}: no legends.xml for it")
+    if not pairs:
+        print(f"\nERROR: No legends exports found in {directory}")
+        return False
 
-if __name__ == '__main__':
-    import sys
+    workers = max(1, min(workers, len(pairs)))
+    print(f"\nImporting {len(pairs)} worlds, {workers} at a time:")
+    for legends_path, plus_path in pairs:
+        print(f"  {legends_path}" + (f" + {plus_path.name}" if plus_path else ""))
+    # Forked workers would otherwise repeat our buffered output
+    sys.stdout.flush()
+
+    start = time.perf_counter()
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(import_batch_world, legends_path, plus_path, options): legends_path
+            for legends_path, plus_path in pairs
+        }
+        for future in as_completed(futures):
+            legends_path = futures[future]
+            success, output = future.result()
+            if not success:
+                failed.append(legends_path)
+            print("\n" + "-" * 50)
+            print(f"{legends_path}: {'done' if success else 'FAILED'}")
+            print("-" * 50)
+            print(output.rstrip())
+            sys.stdout.flush()
+
+    print("\n" + "=" * 50)
+    print(f"Batch complete in {time.perf_counter() - start:.1f}s: "
+          f"{len(pairs) - len(failed)} imported, {len(failed)} failed.")
+    for legends_path in failed:
+        print(f"  Failed: {legends_path}")
+    print("=" * 50)
+    return not failed
 
-    # Check for merge mode: --merge <world_id> <db_path> <plus_path>
-    if len(sys.argv) > 1 and sys.argv[1] == '--merge':
-        if len(sys.argv) < 5:
-            print("Usage: build.py --merge <world_id> <db_path> <plus_path>")
+
+if __name__ == '__main__':
+    # Background jobs (see jobs.py) pass --job <job_id> first
+    args = sys.argv[1:]
+    job_id = None
+    if args[:1] == ['--job'] and len(args) > 1:
+        job_id = args[1]
+        del args[:2]
+
+    # --progress FILE writes structured progress events as JSON lines
+    if '--progress' in args:
+        i = args.index('--progress')
+        PROGRESS.open(args[i + 1])
+        del args[i:i + 2]
+
+    # --migrate [world_id] brings all world databases, or one, up to the current schema
+    if args[:1] == ['--migrate']:
+        sys.exit(0 if run_migrate(args[1] if len(args) > 1 else None) else 1)
+
+    # --batch-size N applies to imports and merges alike
+    batch_size = BATCH_SIZE
+    if '--batch-size' in args:
+        i = args.index('--batch-size')
+        batch_size = int(args[i + 1])
+        del args[i:i + 2]
+
+    # Check for merge mode: --merge <world_id> <db_path> <plus_path> [--batch-size N]
+    if args[:1] == ['--merge']:
+        if len(args) < 4:
+            print("Usage: build.py --merge <world_id> <db_path> <plus_path> [--batch-size N]")
             sys.exit(1)
-        world_id = sys.argv[2]
-        db_path = sys.argv[3]
-        plus_path = sys.argv[4]
-        success = run_merge_plus(world_id, db_path, plus_path)
+        world_id = args[1]
+        db_path = args[2]
+        plus_path = args[3]
+        success = run_merge_plus(world_id, db_path, plus_path, batch_size)
         sys.exit(0 if success else 1)
 
-    # Normal import mode
-    legends_path = sys.argv[1] if len(sys.argv) > 1 else None
-    plus_path = sys.argv[2] if len(sys.argv) > 2 else None
+    # Normal import mode: [--parallel | --pipeline] [--bulk] [--batch-size N] [--shards N]
+    #                    [--no-cache | --clone] [--update] [--compact-extra] [legends_path] [plus_path]
+    # Batch mode takes the same options: --batch <directory> [--workers N]
+    batch_dir = None
+    if '--batch' in args:
+        i = args.index('--batch')
+        batch_dir = args[i + 1]
+        del args[i:i + 2]
+    workers = BATCH_WORKERS
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    parallel = '--parallel' in args
+    if parallel:
+        args.remove('--parallel')
+    pipeline = '--pipeline' in args
+    if pipeline:
+        args.remove('--pipeline')
+    bulk = '--bulk' in args
+    if bulk:
+        args.remove('--bulk')
+    shards = 0
+    if '--shards' in args:
+        i = args.index('--shards')
+        shards = int(args[i + 1])
+        del args[i:i + 2]
+    # --no-cache imports even exports an existing world came from; --clone copies that world
+    cache = '--no-cache' not in args
+    if not cache:
+        args.remove('--no-cache')
+    clone = '--clone' in args
+    if clone:
+        args.remove('--clone')
+    # --update applies a later export of an existing world to it
+    update = '--update' in args
+    if update:
+        args.remove('--update')
+    # --compact-extra stores event extra_data as compact BLOBs instead of JSON text
+    compact_extra = '--compact-extra' in args
+    if compact_extra:
+        args.remove('--compact-extra')
+    legends_path = args[0] if len(args) > 0 else None
+    plus_path = args[1] if len(args) > 1 else None
+
+    if batch_dir is not None:
+        success = run_batch(batch_dir, workers, parallel=parallel, batch_size=batch_size, bulk=bulk,
+                            pipeline=pipeline, shards=shards, cache=cache, clone=clone, update=update,
+                            compact_extra=compact_extra)
+        sys.exit(0 if success else 1)
 
-    success = run_import(legends_path, plus_path)
+    success = run_import(legends_path, plus_path, parallel=parallel, batch_size=batch_size, bulk=bulk,
+                         pipeline=pipeline, shards=shards, job_id=job_id, cache=cache, clone=clone,
+                         update=update, compact_extra=compact_extra)
     sys.exit(0 if success else 1)
@@ -4,7 +4,10 @@ Database connection helpers for DF Tales.
 
 import sqlite3
 from pathlib import Path
-from flask import g
+from flask import g, current_app
+
+from extra_data import extra_json
+from world_schema import world_needs_migration
 
 # Paths
 BASE_DIR = Path(__file__).parent
@@ -12,26 +15,57 @@ DATA_DIR = BASE_DIR / "data"
 MASTER_DB_PATH = DATA_DIR / "master.db"
 MASTER_SCHEMA_PATH = BASE_DIR / "master_schema.sql"
 
+# Set once this process has created or migrated the master schema (see connect_master_db)
+_master_schema_ready = False
+
+# World databases found up to date with the current schema (see is_world_migrating)
+_migrated_worlds = set()
+
+
+def connect_master_db():
+    """
+    Open a new master database connection. The first one in a process
+    creates or migrates the schema; later ones are plain connections, so
+    readers like job status polls don't take the write lock.
+    """
+    global _master_schema_ready
+    if not _master_schema_ready:
+        DATA_DIR.mkdir(exist_ok=True)
+    conn = sqlite3.connect(MASTER_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if not _master_schema_ready:
+        init_master_schema(conn)
+        _master_schema_ready = True
+    return conn
+
+
+def init_master_schema(conn):
+    """Create the master database schema, or migrate one from an older version."""
+    # Initialize schema if needed
+    with open(MASTER_SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+    # Migration: add has_plus and has_map columns if they don't exist,
+    # in one write transaction so concurrent imports migrate once
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("PRAGMA table_info(worlds)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'has_plus' not in columns:
+        cursor.execute("ALTER TABLE worlds ADD COLUMN has_plus INTEGER DEFAULT 0")
+    if 'has_map' not in columns:
+        cursor.execute("ALTER TABLE worlds ADD COLUMN has_map INTEGER DEFAULT 0")
+    if 'content_hash' not in columns:
+        cursor.execute("ALTER TABLE worlds ADD COLUMN content_hash TEXT")
+    if 'status' not in columns:
+        cursor.execute("ALTER TABLE worlds ADD COLUMN status TEXT DEFAULT 'complete'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_worlds_content_hash ON worlds(content_hash)")
+    conn.commit()
+
 
 def get_master_db():
     """Get master database connection."""
     if 'master_db' not in g:
-        DATA_DIR.mkdir(exist_ok=True)
-        g.master_db = sqlite3.connect(MASTER_DB_PATH)
-        g.master_db.row_factory = sqlite3.Row
-        # Initialize schema if needed
-        with open(MASTER_SCHEMA_PATH) as f:
-            g.master_db.executescript(f.read())
-        # Migration: add has_plus and has_map columns if they don't exist
-        cursor = g.master_db.cursor()
-        cursor.execute("PRAGMA table_info(worlds)")
-        columns = [row[1] for row in cursor.fetchall()]
-        if 'has_plus' not in columns:
-            cursor.execute("ALTER TABLE worlds ADD COLUMN has_plus INTEGER DEFAULT 0")
-            g.master_db.commit()
-        if 'has_map' not in columns:
-            cursor.execute("ALTER TABLE worlds ADD COLUMN has_map INTEGER DEFAULT 0")
-            g.master_db.commit()
+        g.master_db = connect_master_db()
     return g.master_db
 
 
@@ -42,6 +76,33 @@ def get_current_world():
     return dict(row) if row else None
 
 
+def is_world_partial():
+    """Whether the current world is still importing its events and written content (see build.py)."""
+    world = get_current_world()
+    return bool(world) and world.get('status') == 'partial'
+
+
+def is_world_migrating():
+    """
+    Whether the current world was imported by an older build.py and is
+    being migrated to the current schema. Migrating a large world takes
+    minutes, so a background job does it (see jobs.start_world_migration),
+    started by the first request that finds it needed.
+    """
+    if 'world_migrating' not in g:
+        g.world_migrating = False
+        db = get_db()
+        world = get_current_world()
+        if db is not None and world['db_path'] not in _migrated_worlds:
+            if world_needs_migration(db):
+                from jobs import start_world_migration
+                start_world_migration(current_app._get_current_object(), world['id'])
+                g.world_migrating = True
+            else:
+                _migrated_worlds.add(world['db_path'])
+    return g.world_migrating
+
+
 def get_all_worlds():
     """Get all available worlds from master database."""
     db = get_master_db()
@@ -71,6 +132,22 @@ def close_db(error=None):
         master_db.close()
 
 
+def get_events_extra_data(event_ids):
+    """
+    Get the extra_data JSON text of events, as {event_id: text}, for just
+    the events listed; those without any are left out.
+    """
+    db = get_db()
+    event_ids = list(event_ids)
+    if not db or not event_ids:
+        return {}
+    placeholders = ', '.join('?' * len(event_ids))
+    rows = db.execute(
+        f"SELECT event_id, extra_data FROM event_extra WHERE event_id IN ({placeholders})", event_ids
+    ).fetchall()
+    return {row['event_id']: extra_json(row['extra_data']) for row in rows}
+
+
 def get_stats():
     """Get database statistics."""
     db = get_db()
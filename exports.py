@@ -0,0 +1,24 @@
+"""
+Export file names for DF Tales.
+Shared by build.py, which imports the exports, and jobs.py, which saves
+uploaded ones for it, so both recognise the same files.
+"""
+
+import bz2
+import gzip
+import lzma
+from pathlib import Path
+
+# Compressed exports are decompressed as they are read
+COMPRESSED_SUFFIXES = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+# A zip archive holds legends.xml, and legends_plus.xml if there is one
+ARCHIVE_SUFFIX = '.zip'
+
+# An export still arriving in a chunked upload (see jobs.py) has a
+# <name>.upload marker next to it, holding its final size in bytes
+UPLOAD_MARKER = '.upload'
+
+
+def upload_marker(path):
+    """Path of the marker kept next to an export while it is being uploaded."""
+    return Path(f"{path}{UPLOAD_MARKER}")
@@ -0,0 +1,90 @@
+"""
+Encodings of event_extra.extra_data for DF Tales.
+
+Event fields without a column of their own are kept as JSON text, or with
+build.py --compact-extra, as a compact BLOB: a format byte, then the JSON
+text deflated against a preset dictionary of the field names events have
+in the exports, so each name costs a few bits instead of its full text.
+Readers accept both; TEXT values are JSON, BLOB values compact.
+"""
+
+import json
+import zlib
+
+# Event fields found in extra_data, from legends.xml and legends_plus.
+# Deflate refers back to the end of the dictionary most cheaply, so the
+# most common fields come last.
+EXTRA_KEYS = (
+    'abuse_type', 'account_shift', 'action', 'agreement_id', 'allotment', 'allotment_index',
+    'ally_defense_bonus', 'appointer_hfid', 'arresting_enid', 'artifact', 'attacker_civ_id',
+    'attacker_general_hfid', 'attacker_hfid', 'attacker_merc_enid', 'bodies', 'body_part',
+    'builder_hf', 'builder_hfid', 'building_custom', 'building_subtype', 'building_type',
+    'caste', 'changee', 'changee_hfid', 'changer', 'changer_hfid', 'circumstance', 'circumstance_id',
+    'civ_entity', 'claim', 'coconspirator_hfid', 'competitor_hfid', 'confessed_after_apb_arrest_enid',
+    'construction', 'contact_hfid', 'convicted_hfid', 'convicter_enid', 'corrupt_convicter_hfid',
+    'corruptor_hfid', 'crime', 'd_support_merc_enid', 'defender_civ_id', 'defender_general_hfid',
+    'defender_merc_enid', 'dest_entity_id', 'dest_site_id', 'detected', 'doer', 'doer_hfid',
+    'eater', 'enslaved_hfid', 'entity_1', 'entity_2', 'expelled_hfid', 'first', 'fooled_hfid',
+    'form_id', 'framer_hfid', 'giver_entity_id', 'giver_hist_figure_id', 'group', 'group_hfid',
+    'hf_rep_1_of_2', 'hf_rep_2_of_1', 'hfid_target', 'identity_id', 'implicated_hfid', 'injury_type',
+    'instigator_hfid', 'interaction', 'interrogator_hfid', 'item_mat', 'item_subtype', 'item_type',
+    'joiner_entity_id', 'joining_enid', 'knowledge', 'lure_hfid', 'maker', 'maker_entity', 'mat',
+    'method', 'modifier_hfid', 'new_ab_entity_id', 'new_caste', 'new_job', 'new_leader_hfid',
+    'new_race', 'new_site_civ_id', 'new_structure', 'occasion_id', 'old_job', 'old_structure',
+    'overthrown_hfid', 'part_lost', 'payer_entity_id', 'payer_hfid', 'persecutor_enid',
+    'persecutor_hfid', 'plotter_hfid', 'position', 'position_profile_id', 'position_taker_hfid',
+    'promise_to_hfid', 'race', 'receiver_entity_id', 'receiver_hist_figure_id', 'relationship',
+    'resident_civ_id', 'schedule_id', 'secret_goal', 'seeker_hf', 'seller_hfid', 'site_civ_id',
+    'site_entity_id', 'slayer_caste', 'slayer_item_id', 'slayer_race', 'slayer_shooter_item_id',
+    'snatcher_hfid', 'source_entity_id', 'source_site_id', 'stash_site', 'student_hfid', 'target',
+    'target_enid', 'target_hf', 'target_hfid', 'teacher_hfid', 'theft_method', 'topic',
+    'trader_entity_id', 'trader_hfid', 'trickster', 'trickster_hfid', 'unit_id', 'victim',
+    'woundee', 'woundee_hfid', 'wounder', 'wounder_hfid', 'wc_id', 'written_content',
+    'hf', 'hf_target', 'hfid1', 'hist_fig_id', 'hist_figure_id', 'cause', 'mood', 'position_id',
+    'civ', 'site', 'coords', 'reason', 'state', 'item', 'mountain_peak_id', 'hfid2',
+    'group_1_hfid', 'group_2_hfid', 'link_type', 'histfig', 'creator_hfid', 'victim_hf',
+    'feature_layer_id', 'subregion_id', 'seconds72',
+)
+
+# Format byte of compact values -> their preset dictionary. A changed
+# dictionary needs a new format byte, as old values only decode with theirs.
+COMPACT_DICTIONARIES = {
+    1: ''.join(f', "{key}": "' for key in EXTRA_KEYS).encode(),
+}
+COMPACT_FORMAT = 1
+# Raw deflate (no header or checksum) with a 4 KiB window, which holds the
+# dictionary; extra_data is rarely longer
+COMPACT_WBITS = -12
+
+
+def encode_extra(text):
+    """Encode the JSON text of an event's extra_data as a compact BLOB (None stays None)."""
+    if text is None:
+        return None
+    compressor = zlib.compressobj(6, zlib.DEFLATED, COMPACT_WBITS, 2, zlib.Z_DEFAULT_STRATEGY,
+                                  COMPACT_DICTIONARIES[COMPACT_FORMAT])
+    return bytes((COMPACT_FORMAT,)) + compressor.compress(text.encode()) + compressor.flush()
+
+
+def extra_json(value):
+    """
+    The JSON text of an event's extra_data value in either encoding, or
+    None. Raises ValueError for a BLOB that isn't a compact value.
+    """
+    if not isinstance(value, bytes):
+        return value
+    dictionary = COMPACT_DICTIONARIES.get(value[0]) if value else None
+    if dictionary is None:
+        raise ValueError("Unknown extra_data encoding")
+    decompressor = zlib.decompressobj(COMPACT_WBITS, dictionary)
+    try:
+        return (decompressor.decompress(value[1:]) + decompressor.flush()).decode()
+    except zlib.error as e:
+        raise ValueError(f"Corrupt extra_data: {e}") from None
+
+
+def decode_extra(value):
+    """An event's extra_data value, in either encoding, as a dict ({} if it has none)."""
+    if not value:
+        return {}
+    return json.loads(extra_json(value))
@@ -3,7 +3,6 @@ Helper functions for DF Tales.
 Type info getters and formatters for races, sites, structures, artifacts, events.
 """
 
-import json
 from pathlib import Path
 from markupsafe import Markup
 
@@ -16,6 +15,7 @@ from data.mappings import (
     EVENT_TYPE_DATA, WRITTEN_TYPE_COLORS,
 )
 from db import get_db
+from extra_data import decode_extra
 
 
 def get_material_color(material):
@@ -142,7 +142,7 @@ def format_event_details(event):
     extra = {}
     if event['extra_data']:
         try:
-            extra = json.loads(event['extra_data'])
+            extra = decode_extra(event['extra_data'])
         except:
             pass
 
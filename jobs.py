@@ -0,0 +1,324 @@
+"""
+Background import jobs for DF Tales.
+Runs build.py imports, merges and migrations on a bounded pool of worker threads, each
+job in its own directory under data/jobs, with its status kept in master.db.
+"""
+
+import json
+import shutil
+import subprocess
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from db import connect_master_db, DATA_DIR, BASE_DIR
+from exports import COMPRESSED_SUFFIXES, ARCHIVE_SUFFIX, upload_marker
+
+JOBS_DIR = DATA_DIR / 'jobs'
+OUTPUT_NAME = 'output.log'
+PROGRESS_NAME = 'progress.jsonl'
+
+# Job columns clients may see: not work_dir, a path on the server
+PUBLIC_JOB_COLUMNS = ('id', 'kind', 'status', 'world_id', 'returncode', 'error',
+                      'created_at', 'started_at', 'finished_at')
+
+# Imports running at once; further jobs wait in the queue
+MAX_WORKERS = 2
+
+# Exports a job takes, saved as <field>.xml, .xml.gz/.bz2/.xz or .zip
+UPLOAD_FIELDS = ('legends', 'legends_plus')
+# Bytes copied at a time from a chunk's request body
+UPLOAD_COPY_SIZE = 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+# Held while checking for and creating a world's migration job
+_migration_lock = threading.Lock()
+# One lock per upload, so chunks of one file are appended one at a time
+_upload_locks = {}
+_upload_locks_lock = threading.Lock()
+
+
+def init_app(app):
+    """Fail jobs left queued or running by a previous server process, removing their uploads."""
+    conn = connect_master_db()
+    interrupted = conn.execute(
+        "SELECT work_dir FROM jobs WHERE status IN ('uploading', 'queued', 'running')"
+    ).fetchall()
+    conn.execute("""
+        UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart',
+            finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('uploading', 'queued', 'running')
+    """)
+    conn.commit()
+    conn.close()
+    for row in interrupted:
+        clean_work_dir(Path(row['work_dir']))
+
+
+def get_executor():
+    """Get the worker pool, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='import-job')
+        return _executor
+
+
+def create_job(kind, world_id=None, status='queued'):
+    """
+    Register a job and create its directory. Returns (job_id, work_dir).
+    Jobs created 'uploading' wait for their files (see queue_uploaded_job).
+    """
+    job_id = uuid.uuid4().hex[:12]
+    work_dir = JOBS_DIR / job_id
+    work_dir.mkdir(parents=True)
+
+    conn = connect_master_db()
+    conn.execute(
+        "INSERT INTO jobs (id, kind, status, world_id, work_dir) VALUES (?, ?, ?, ?, ?)",
+        (job_id, kind, status, world_id, str(work_dir))
+    )
+    conn.commit()
+    conn.close()
+    return job_id, work_dir
+
+
+def start_job(app, job_id, args, on_success=None):
+    """
+    Queue a build.py run for a job created with create_job.
+    on_success(world_id) is called in an app context once build.py succeeds.
+    """
+    get_executor().submit(run_job, app, job_id, args, on_success)
+
+
+def start_world_migration(app, world_id):
+    """Queue a build.py --migrate job for a world, unless one is already queued or running."""
+    with _migration_lock:
+        conn = connect_master_db()
+        row = conn.execute(
+            "SELECT 1 FROM jobs WHERE world_id = ? AND kind = 'migrate' AND status IN ('queued', 'running')",
+            (world_id,)
+        ).fetchone()
+        conn.close()
+        if row is not None:
+            return
+        job_id, _ = create_job('migrate', world_id)
+    start_job(app, job_id, ['--migrate', world_id])
+
+
+def run_job(app, job_id, args, on_success):
+    """Run build.py for a job, logging its output to the job directory."""
+    job = get_job(job_id)
+    work_dir = JOBS_DIR / job_id
+    update_job(job_id, status='running', started_at=True)
+
+    try:
+        cmd = [sys.executable, str(BASE_DIR / 'build.py'), '--job', job_id,
+               '--progress', str(work_dir / PROGRESS_NAME)] + [str(arg) for arg in args]
+        with open(work_dir / OUTPUT_NAME, 'w') as output:
+            result = subprocess.run(cmd, stdout=output, stderr=subprocess.STDOUT, cwd=BASE_DIR)
+
+        if result.returncode != 0:
+            update_job(job_id, status='failed', returncode=result.returncode,
+                       error=f"build.py exited with code {result.returncode}", finished_at=True)
+            return
+
+        # Imports record the world they created on the job row
+        world_id = get_job(job_id)['world_id'] or job['world_id']
+        if on_success:
+            with app.app_context():
+                on_success(world_id)
+        update_job(job_id, status='done', returncode=0, finished_at=True)
+    except Exception as e:
+        update_job(job_id, status='failed', error=str(e), finished_at=True)
+    finally:
+        clean_work_dir(work_dir)
+
+
+def clean_work_dir(work_dir):
+    """Remove the uploads and other files of a finished job, keeping only its output log and progress events."""
+    if not work_dir.is_dir():
+        return
+    for path in work_dir.iterdir():
+        if path.name not in (OUTPUT_NAME, PROGRESS_NAME):
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+
+def update_job(job_id, started_at=False, finished_at=False, **fields):
+    """Update columns of a job row; started_at/finished_at stamp the current time."""
+    assignments = [f"{column} = ?" for column in fields]
+    if started_at:
+        assignments.append("started_at = CURRENT_TIMESTAMP")
+    if finished_at:
+        assignments.append("finished_at = CURRENT_TIMESTAMP")
+
+    conn = connect_master_db()
+    conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = ?", (*fields.values(), job_id))
+    conn.commit()
+    conn.close()
+
+
+def get_job(job_id):
+    """Get a job as a dict, or None."""
+    conn = connect_master_db()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def public_job(job):
+    """A job dict with only its PUBLIC_JOB_COLUMNS, to send to clients."""
+    return {column: job[column] for column in PUBLIC_JOB_COLUMNS}
+
+
+def list_jobs(limit=20):
+    """Get the most recent jobs, newest first, with their PUBLIC_JOB_COLUMNS."""
+    conn = connect_master_db()
+    rows = conn.execute(
+        f"SELECT {', '.join(PUBLIC_JOB_COLUMNS)} FROM jobs ORDER BY created_at DESC, rowid DESC LIMIT ?", (limit,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def world_import_running(world_id):
+    """Whether a running job is still importing a world (registered as 'partial' until it finishes)."""
+    conn = connect_master_db()
+    row = conn.execute(
+        "SELECT 1 FROM jobs WHERE world_id = ? AND status = 'running' AND kind IN ('import', 'update')", (world_id,)
+    ).fetchone()
+    conn.close()
+    return row is not None
+
+
+def get_job_output(job_id):
+    """Get the build.py output of a job so far, or None if it has none yet."""
+    output_path = JOBS_DIR / job_id / OUTPUT_NAME
+    if not output_path.exists():
+        return None
+    return output_path.read_text(errors='replace')
+
+
+def read_job_progress(job_id, offset=0):
+    """
+    Read progress events a job's build.py has written since byte offset.
+    Returns (events, new_offset); a partly written last line is left for
+    the next read.
+    """
+    progress_path = JOBS_DIR / job_id / PROGRESS_NAME
+    if not progress_path.exists():
+        return [], offset
+    with open(progress_path, 'rb') as infile:
+        infile.seek(offset)
+        data = infile.read()
+
+    end = data.rfind(b'\n') + 1
+    events = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+    return events, offset + end
+
+
+def export_filename(field, upload_filename):
+    """
+    Name to save an uploaded export as, keeping its compression suffix
+    (legends.xml.gz, legends.zip). None if it isn't a supported type.
+    """
+    suffix = Path(upload_filename).suffix.lower()
+    if suffix == ARCHIVE_SUFFIX:
+        return field + ARCHIVE_SUFFIX
+    if suffix in COMPRESSED_SUFFIXES:
+        return f'{field}.xml{suffix}'
+    if suffix == '.xml':
+        return f'{field}.xml'
+    return None
+
+
+def create_upload(work_dir, filename, size):
+    """
+    Create an empty export in a job directory for a chunked upload of size
+    bytes, marked as still uploading until the last chunk arrives.
+    """
+    path = work_dir / filename
+    path.touch()
+    if size > 0:
+        upload_marker(path).write_text(str(size))
+    return path
+
+
+def get_upload(job_id, field):
+    """
+    Get the state of a chunked upload ('legends' or 'legends_plus') as a
+    dict with the bytes received so far and the final size, or None.
+    """
+    names = [f"{field}.xml", field + ARCHIVE_SUFFIX] + [f"{field}.xml{suffix}" for suffix in COMPRESSED_SUFFIXES]
+    for path in (JOBS_DIR / job_id / name for name in names):
+        if not path.exists():
+            continue
+        marker = upload_marker(path)
+        received = path.stat().st_size
+        return {
+            'filename': path.name,
+            'received': received,
+            'size': int(marker.read_text()) if marker.exists() else received,
+            'complete': not marker.exists(),
+        }
+    return None
+
+
+def append_upload_chunk(job_id, field, offset, stream, length=None):
+    """
+    Append a chunk of a chunked upload, copied from stream, at byte offset.
+    Returns (upload, written): the upload's state afterwards, and whether the
+    chunk was written. Nothing is written unless offset is where the upload
+    stands and the chunk (of length bytes, if known) fits in its size.
+
+    A chunk cut off by a dropped connection keeps the bytes that arrived,
+    so a client resumes from the 'received' offset of get_upload().
+    """
+    with _upload_locks_lock:
+        lock = _upload_locks.setdefault((job_id, field), threading.Lock())
+
+    with lock:
+        upload = get_upload(job_id, field)
+        if upload is None or upload['complete'] or offset != upload['received']:
+            return upload, False
+        remaining = upload['size'] - offset
+        if length is not None and length > remaining:
+            return upload, False
+
+        path = JOBS_DIR / job_id / upload['filename']
+        with open(path, 'ab') as out:
+            # Flushed as it goes, since build.py may be reading the file already
+            while remaining:
+                data = stream.read(min(UPLOAD_COPY_SIZE, remaining))
+                if not data:
+                    break
+                out.write(data)
+                out.flush()
+                remaining -= len(data)
+
+        if not remaining:
+            # Written before the marker goes, so build.py sees every byte
+            upload_marker(path).unlink()
+        return get_upload(job_id, field), True
+
+
+def queue_uploaded_job(job_id):
+    """
+    Move an 'uploading' job to 'queued' once all its uploads are complete.
+    Returns True if this call did, so the job is started exactly once.
+    """
+    uploads = [get_upload(job_id, field) for field in UPLOAD_FIELDS]
+    if not all(upload['complete'] for upload in uploads if upload):
+        return False
+
+    conn = connect_master_db()
+    cursor = conn.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'uploading'", (job_id,))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount == 1
@@ -8,7 +8,25 @@ CREATE TABLE IF NOT EXISTS worlds (
     db_path TEXT NOT NULL,         -- Path to world database
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     is_current INTEGER DEFAULT 0,  -- 1 if this is the active world
-    has_plus INTEGER DEFAULT 0     -- 1 if imported with legends_plus.xml
+    has_plus INTEGER DEFAULT 0,    -- 1 if imported with legends_plus.xml
+    content_hash TEXT,             -- SHA-256 of the imported exports, for the import cache
+    status TEXT DEFAULT 'complete' -- 'partial' while events and written content are still importing
 );
 
 CREATE INDEX IF NOT EXISTS idx_worlds_current ON worlds(is_current);
+
+-- Background import and merge jobs (see jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,           -- Random hex ID, also the job directory name
+    kind TEXT NOT NULL,            -- 'import', 'update', 'merge' or 'migrate'
+    status TEXT NOT NULL DEFAULT 'queued',  -- uploading, queued, running, done or failed
+    world_id TEXT,                 -- World merged into, or created by an import
+    work_dir TEXT NOT NULL,        -- Job directory (uploads and output.log)
+    returncode INTEGER,            -- build.py exit code
+    error TEXT,                    -- Failure summary
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at);
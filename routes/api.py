@@ -6,7 +6,8 @@ JSON endpoints for modals, search, graphs, and family trees.
 import json
 from flask import Blueprint, request, jsonify
 
-from db import get_db, get_current_year
+from db import get_db, get_current_year, get_events_extra_data, is_world_partial, is_world_migrating
+from extra_data import extra_json
 from helpers import (
     get_race_info, get_site_type_info, get_structure_type_info,
     get_event_type_info, get_written_type_info
@@ -15,6 +16,18 @@ from helpers import (
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 
+def importing_response():
+    """Response for data a partial world hasn't imported yet; clients retry later."""
+    return jsonify({'error': 'World is still importing', 'importing': True}), 503
+
+
+@api_bp.before_request
+def migrating_response():
+    """Responds as for a partial world while the current world is migrated (see is_world_migrating)."""
+    if is_world_migrating():
+        return importing_response()
+
+
 def get_artifact_display_name(artifact_dict):
     """Build display name for artifact from available fields if name is empty."""
     if artifact_dict.get('name'):
@@ -128,23 +141,27 @@ def figure(figure_id):
             r['related_race_img'] = race_info['img']
         relationships.append(r)
 
-    # Get life events (where this figure is involved)
+    # Get life events (where this figure is involved, in any role)
     events = db.execute("""
-        SELECT e.*, s.name as site_name, s.type as site_type,
+        SELECT e.*, x.extra_data, s.name as site_name, s.type as site_type,
                slayer.name as slayer_name, slayer.race as slayer_race
-        FROM historical_events e
+        FROM (
+            SELECT DISTINCT year, event_id FROM event_participants
+            WHERE hfid = ?
+            ORDER BY year ASC, event_id ASC
+            LIMIT 100
+        ) p
+        JOIN historical_events e ON e.id = p.event_id
+        LEFT JOIN event_extra x ON x.event_id = e.id
         LEFT JOIN sites s ON e.site_id = s.id
         LEFT JOIN historical_figures slayer ON e.slayer_hfid = slayer.id
-        WHERE e.hfid = ? OR e.slayer_hfid = ?
-           OR e.extra_data LIKE ?
-           OR e.extra_data LIKE ?
         ORDER BY e.year ASC, e.id ASC
-        LIMIT 100
-    """, [figure_id, figure_id, f'%"hfid2": "{figure_id}"%', f'%"victim_hf": "{figure_id}"%']).fetchall()
+    """, [figure_id]).fetchall()
 
     events_list = []
     for ev in events:
         ev_dict = dict(ev)
+        ev_dict['extra_data'] = extra_json(ev_dict['extra_data'])
         ev_dict['type_label'] = get_event_type_info(ev_dict.get('type'))['label']
         # Parse extra_data to get hfid2 name and victim_hf name if present
         if ev_dict.get('extra_data'):
@@ -180,7 +197,8 @@ def figure(figure_id):
         'affiliations': [dict(a) for a in affiliations],
         'site_links': [dict(s) for s in site_links],
         'relationships': relationships,
-        'events': events_list
+        'events': events_list,
+        'importing': is_world_partial()
     })
 
 
@@ -278,7 +296,7 @@ def site(site_id):
 
     # Get historical events at this site (limited)
     events_cursor = db.execute("""
-        SELECT he.id, he.year, he.type, he.hfid, he.slayer_hfid, he.extra_data,
+        SELECT he.id, he.year, he.type, he.hfid, he.slayer_hfid,
                he.state, he.reason, he.death_cause, he.artifact_id, he.civ_id, he.entity_id,
                hf.name as hf_name, hf.race as hf_race,
                slayer.name as slayer_name, slayer.race as slayer_race
@@ -290,8 +308,10 @@ def site(site_id):
         LIMIT 20
     """, [site_id])
 
+    event_rows = events_cursor.fetchall()
+    extra_data = get_events_extra_data(row['id'] for row in event_rows)
     events_list = []
-    for ev_row in events_cursor.fetchall():
+    for ev_row in event_rows:
         ev = {
             'id': ev_row['id'],
             'year': ev_row['year'],
@@ -308,7 +328,7 @@ def site(site_id):
             'artifact_id': ev_row['artifact_id'],
             'civ_id': ev_row['civ_id'],
             'entity_id': ev_row['entity_id'],
-            'extra_data': ev_row['extra_data']
+            'extra_data': extra_data.get(ev_row['id'])
         }
         # Get artifact name/type for artifact events
         if ev['artifact_id']:
@@ -324,7 +344,8 @@ def site(site_id):
         'linked_figures': figures_list,
         'settlers': settlers_list,
         'artifacts': artifacts_list,
-        'events': events_list
+        'events': events_list,
+        'importing': is_world_partial()
     })
 
 
@@ -378,7 +399,7 @@ def artifact(artifact_id):
     # Get events related to this artifact
     events = db.execute("""
         SELECT he.id, he.year, he.type, he.hfid, he.slayer_hfid, he.death_cause,
-               he.site_id, he.extra_data,
+               he.site_id,
                hf.name as hf_name, hf.race as hf_race,
                slayer.name as slayer_name, slayer.race as slayer_race,
                s.name as site_name, s.type as site_type
@@ -386,15 +407,16 @@ def artifact(artifact_id):
         LEFT JOIN historical_figures hf ON he.hfid = hf.id
         LEFT JOIN historical_figures slayer ON he.slayer_hfid = slayer.id
         LEFT JOIN sites s ON he.site_id = s.id
-        WHERE he.artifact_id = ?
-           OR he.extra_data LIKE ?
+        WHERE he.artifact_id = ? OR he.item_id = ?
         ORDER BY he.year ASC
         LIMIT 50
-    """, [artifact_id, f'%"item": "{artifact_id}"%']).fetchall()
+    """, [artifact_id, artifact_id]).fetchall()
+    extra_data = get_events_extra_data(ev['id'] for ev in events)
 
     events_list = []
     for ev in events:
         ev_dict = dict(ev)
+        ev_dict['extra_data'] = extra_data.get(ev_dict['id'])
         ev_dict['type_label'] = get_event_type_info(ev_dict.get('type'))['label']
 
         # Add race info for hfid figure
@@ -485,7 +507,8 @@ def artifact(artifact_id):
     return jsonify({
         'artifact': art_dict,
         'written_contents': written_list,
-        'events': events_list
+        'events': events_list,
+        'importing': is_world_partial()
     })
 
 
@@ -538,6 +561,8 @@ def written(written_id):
     db = get_db()
     if not db:
         return jsonify({'error': 'Database not found'}), 404
+    if is_world_partial():
+        return importing_response()
 
     written = db.execute("""
         SELECT wc.*,
@@ -639,6 +664,8 @@ def graph(figure_id):
     db = get_db()
     if not db:
         return jsonify({'error': 'Database not found'}), 404
+    if is_world_partial():
+        return importing_response()
 
     depth = request.args.get('depth', 1, type=int)
     depth = min(depth, 3)  # Limit depth to prevent huge graphs
@@ -734,6 +761,8 @@ def family_tree(figure_id):
     db = get_db()
     if not db:
         return jsonify({'error': 'Database not found'}), 404
+    if is_world_partial():
+        return importing_response()
 
     def get_figure_data(fig_id):
         """Get figure info with race data."""
@@ -910,10 +939,10 @@ def region(region_id):
                hf.name as hf_name
         FROM historical_events he
         LEFT JOIN historical_figures hf ON he.hfid = hf.id
-        WHERE he.extra_data LIKE ?
+        WHERE he.subregion_id = ?
         ORDER BY he.year DESC
         LIMIT 20
-    """, [f'%"subregion_id": {region_id}%']).fetchall()
+    """, [region_id]).fetchall()
 
     events_list = []
     for ev in events:
@@ -954,16 +983,16 @@ def underground_region(region_id):
     }
     region_dict['depth_name'] = depth_names.get(region_dict.get('depth'), f"Depth {region_dict.get('depth')}")
 
-    # Get events in this underground region
+    # Get events in this underground region (the feature layer of the event)
     events = db.execute("""
         SELECT he.id, he.year, he.type, he.hfid,
                hf.name as hf_name
         FROM historical_events he
         LEFT JOIN historical_figures hf ON he.hfid = hf.id
-        WHERE he.extra_data LIKE ?
+        WHERE he.feature_layer_id = ?
         ORDER BY he.year DESC
         LIMIT 20
-    """, [f'%"subregion_id": {region_id}%']).fetchall()
+    """, [region_id]).fetchall()
 
     events_list = []
     for ev in events:
@@ -1125,10 +1154,10 @@ def peak(peak_id):
                hf.name as hf_name
         FROM historical_events he
         LEFT JOIN historical_figures hf ON he.hfid = hf.id
-        WHERE he.extra_data LIKE ?
+        WHERE he.mountain_peak_id = ?
         ORDER BY he.year DESC
         LIMIT 20
-    """, [f'%"mountain_peak_id": {peak_id}%']).fetchall()
+    """, [peak_id]).fetchall()
 
     events_list = []
     for ev in events:
@@ -1149,15 +1178,18 @@ def event(event_id):
     db = get_db()
     if not db:
         return jsonify({'error': 'Database not found'}), 404
+    if is_world_partial():
+        return importing_response()
 
     event = db.execute("""
-        SELECT he.*,
+        SELECT he.*, x.extra_data,
                hf.name as hf_name, hf.race as hf_race,
                s.name as site_name, s.type as site_type,
                slayer.name as slayer_name, slayer.race as slayer_race,
                civ.name as civ_name,
                ent.name as entity_name
         FROM historical_events he
+        LEFT JOIN event_extra x ON x.event_id = he.id
         LEFT JOIN historical_figures hf ON he.hfid = hf.id
         LEFT JOIN sites s ON he.site_id = s.id
         LEFT JOIN historical_figures slayer ON he.slayer_hfid = slayer.id
@@ -1170,6 +1202,7 @@ def event(event_id):
         return jsonify({'error': 'Event not found'}), 404
 
     event_dict = dict(event)
+    event_dict['extra_data'] = extra_json(event_dict['extra_data'])
 
     # Add type info
     type_info = get_event_type_info(event_dict.get('type'))
@@ -5,7 +5,10 @@ Handles figures, sites, map, events, artifacts, written content, and graph pages
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 
-from db import get_db, get_current_world, get_current_year, DATA_DIR
+from db import (
+    get_db, get_current_world, get_current_year, get_events_extra_data, is_world_partial,
+    is_world_migrating, DATA_DIR
+)
 from helpers import (
     get_race_info, get_site_type_info, get_structure_type_info,
     get_artifact_type_info, get_event_type_info
@@ -14,6 +17,18 @@ from helpers import (
 pages_bp = Blueprint('pages', __name__)
 
 
+def importing_page(title, sections):
+    """Loading state for a page whose sections a partial world hasn't imported yet."""
+    return render_template('importing.html', title=title, sections=sections)
+
+
+@pages_bp.before_request
+def migrating_page():
+    """Loading state for every page while the current world is migrated (see is_world_migrating)."""
+    if is_world_migrating():
+        return render_template('importing.html', title='Updating World', sections=None)
+
+
 @pages_bp.route('/figures')
 def figures():
     """List historical figures."""
@@ -639,6 +654,8 @@ def events():
     if not db:
         flash('Database not found. Run import first.', 'error')
         return redirect(url_for('worlds.index'))
+    if is_world_partial():
+        return importing_page('Historical Events', 'historical events')
 
     page = request.args.get('page', 1, type=int)
     per_page = 50
@@ -661,7 +678,11 @@ def events():
     query += " ORDER BY year DESC, id DESC LIMIT ? OFFSET ?"
     params.extend([per_page, offset])
 
-    events_data = db.execute(query, params).fetchall()
+    events_data = [dict(row) for row in db.execute(query, params).fetchall()]
+    # Only the events on this page need their extra_data
+    extra_data = get_events_extra_data(event['id'] for event in events_data)
+    for event in events_data:
+        event['extra_data'] = extra_data.get(event['id'])
     count_query = "SELECT COUNT(*) FROM historical_events WHERE 1=1"
     count_params = []
     if year_filter:
@@ -780,6 +801,8 @@ def written_content():
     if not db:
         flash('Database not found. Run import first.', 'error')
         return redirect(url_for('worlds.index'))
+    if is_world_partial():
+        return importing_page('Written Content', 'written content')
 
     page = request.args.get('page', 1, type=int)
     per_page = 50
@@ -864,6 +887,8 @@ def relations_graph():
     if not db:
         flash('Database not found. Run import first.', 'error')
         return redirect(url_for('worlds.index'))
+    if is_world_partial():
+        return importing_page('Relations Graph', 'relationships')
 
     figure_id = request.args.get('figure', type=int)
     return render_template('graph.html', figure_id=figure_id)
@@ -1,21 +1,35 @@
 """
 World management routes for DF Tales.
-Handles world switching, uploading, deletion, and map management.
+Handles world switching, uploading, deletion, map management and import jobs.
 """
 
-import subprocess
-import sys
+import json
+import time
+from functools import partial
 from pathlib import Path
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app
+from flask import (
+    Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, jsonify, Response
+)
 from PIL import Image
 
 from db import (
     get_master_db, get_current_world, get_all_worlds,
-    get_db, get_stats, get_world_info, DATA_DIR, BASE_DIR
+    get_db, get_stats, get_world_info, DATA_DIR
+)
+from jobs import (
+    create_job, start_job, get_job, public_job, list_jobs, get_job_output, read_job_progress,
+    export_filename, create_upload, get_upload, append_upload_chunk, queue_uploaded_job,
+    world_import_running, UPLOAD_FIELDS, ARCHIVE_SUFFIX
 )
 
 worlds_bp = Blueprint('worlds', __name__)
 
+# Seconds between checks for new progress events, and between keepalives
+PROGRESS_POLL_INTERVAL = 0.5
+PROGRESS_KEEPALIVE = 15
+# Seconds between reads of the job's status, which is in master.db
+PROGRESS_STATUS_INTERVAL = 2
+
 
 def save_world_map(world_id, map_file):
     """Save world map image, converting BMP to PNG if needed."""
@@ -45,12 +59,14 @@ def index():
     all_worlds = get_all_worlds()
     world = get_world_info()
     stats = get_stats()
+    active_jobs = [job for job in list_jobs() if job['status'] in ('uploading', 'queued', 'running')]
 
     return render_template('index.html',
                          world=world,
                          stats=stats,
                          current_world=current_world,
-                         all_worlds=all_worlds)
+                         all_worlds=all_worlds,
+                         active_jobs=active_jobs)
 
 
 @worlds_bp.route('/switch-world/<world_id>', methods=['POST'])
@@ -86,6 +102,10 @@ def delete_world(world_id):
         flash('World not found', 'error')
         return redirect(url_for('worlds.index'))
 
+    if world['status'] == 'partial' and world_import_running(world_id):
+        flash('This world is still importing', 'error')
+        return redirect(url_for('worlds.index'))
+
     # Delete database file and WAL journal files
     db_path = Path(world['db_path'])
     if db_path.exists():
@@ -110,9 +130,21 @@ def delete_world(world_id):
     return redirect(url_for('worlds.index'))
 
 
+def job_response(job_id, message):
+    """Respond to a queued job: JSON for API clients, otherwise flash and redirect."""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'job_id': job_id,
+            'status_url': url_for('worlds.job_status', job_id=job_id),
+            'events_url': url_for('worlds.job_events', job_id=job_id),
+        }), 202
+    flash(message, 'success')
+    return redirect(url_for('worlds.index'))
+
+
 @worlds_bp.route('/upload', methods=['POST'])
 def upload():
-    """Handle file upload and run import."""
+    """Handle file upload and queue an import job."""
     # Check for legends file (required)
     if 'legends' not in request.files or request.files['legends'].filename == '':
         flash('legends.xml file is required', 'error')
@@ -122,67 +154,39 @@ def upload():
     plus_file = request.files.get('legends_plus')
     map_file = request.files.get('world_map')
 
-    # Create uploads directory
-    upload_dir = DATA_DIR / 'uploads'
-    upload_dir.mkdir(exist_ok=True)
+    legends_name = export_filename('legends', legends_file.filename)
+    plus_name = export_filename('legends_plus', plus_file.filename) if plus_file and plus_file.filename else None
+    if legends_name is None or (plus_file and plus_file.filename and plus_name is None):
+        flash('Exports must be .xml files, compressed (.gz, .bz2, .xz) or in a .zip', 'error')
+        return redirect(url_for('worlds.index'))
 
-    # Save uploaded files
-    legends_path = upload_dir / 'legends.xml'
+    # Save uploaded files in the job's own directory, still compressed
+    # An update applies the exports to the existing world of the same name
+    update = bool(request.form.get('update'))
+    job_id, work_dir = create_job('update' if update else 'import')
+    legends_path = work_dir / legends_name
     legends_file.save(legends_path)
 
-    plus_path = None
-    if plus_file and plus_file.filename:
-        plus_path = upload_dir / 'legends_plus.xml'
+    args = (['--update'] if update else []) + [legends_path]
+    if plus_name:
+        plus_path = work_dir / plus_name
         plus_file.save(plus_path)
+        args.append(plus_path)
 
-    # Run import with file paths
-    try:
-        cmd = [sys.executable, str(BASE_DIR / 'build.py'), str(legends_path)]
-        if plus_path:
-            cmd.append(str(plus_path))
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600  # 10 minute timeout
-        )
-
-        if result.returncode == 0:
-            flash('Import completed successfully!', 'success')
-
-            # If map file provided, save it for the newly created world
-            if map_file and map_file.filename:
-                # Get the world that was just created (most recent)
-                world = get_current_world()
-                if world:
-                    if save_world_map(world['id'], map_file):
-                        flash('World map uploaded!', 'success')
-                    else:
-                        flash('Failed to save world map', 'error')
-        else:
-            flash(f'Import failed: {result.stderr}', 'error')
-
-        # Store output for display
-        current_app.config['LAST_BUILD_OUTPUT'] = result.stdout + result.stderr
-
-    except subprocess.TimeoutExpired:
-        flash('Import timed out after 10 minutes', 'error')
-    except Exception as e:
-        flash(f'Error running import: {str(e)}', 'error')
-    finally:
-        # Cleanup uploaded files
-        if legends_path.exists():
-            legends_path.unlink()
-        if plus_path and plus_path.exists():
-            plus_path.unlink()
+    save_map = None
+    if map_file and map_file.filename:
+        map_path = work_dir / ('world_map' + Path(map_file.filename).suffix.lower())
+        map_file.save(map_path)
+        # Save the map for the new world once it's imported
+        save_map = partial(save_world_map, map_file=map_path)
 
-    return redirect(url_for('worlds.index'))
+    start_job(current_app._get_current_object(), job_id, args, save_map)
+    return job_response(job_id, f'Import started (job {job_id}). The new world appears here once its figures and sites are in.')
 
 
 @worlds_bp.route('/merge-plus/<world_id>', methods=['POST'])
 def merge_plus(world_id):
-    """Merge legends_plus.xml into an existing world."""
+    """Queue a job merging legends_plus.xml into an existing world."""
     db = get_master_db()
     cursor = db.cursor()
 
@@ -196,53 +200,149 @@ def merge_plus(world_id):
         flash('This world already has legends_plus data', 'error')
         return redirect(url_for('worlds.index'))
 
+    if world['status'] == 'partial':
+        flash('This world is still importing', 'error')
+        return redirect(url_for('worlds.index'))
+
     # Check for legends_plus file
     if 'legends_plus' not in request.files or request.files['legends_plus'].filename == '':
         flash('legends_plus.xml file is required', 'error')
         return redirect(url_for('worlds.index'))
 
     plus_file = request.files['legends_plus']
+    plus_name = export_filename('legends_plus', plus_file.filename)
+    if plus_name is None:
+        flash('legends_plus must be an .xml file, compressed (.gz, .bz2, .xz) or in a .zip', 'error')
+        return redirect(url_for('worlds.index'))
 
-    # Create uploads directory
-    upload_dir = DATA_DIR / 'uploads'
-    upload_dir.mkdir(exist_ok=True)
-
-    # Save uploaded file
-    plus_path = upload_dir / 'legends_plus.xml'
+    # Save uploaded file in the job's own directory
+    job_id, work_dir = create_job('merge', world_id)
+    plus_path = work_dir / plus_name
     plus_file.save(plus_path)
 
-    # Run merge with file path
-    try:
-        cmd = [
-            sys.executable, str(BASE_DIR / 'build.py'),
-            '--merge', world_id, world['db_path'], str(plus_path)
-        ]
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600  # 10 minute timeout
-        )
-
-        if result.returncode == 0:
-            flash('Legends+ data merged successfully!', 'success')
-        else:
-            flash(f'Merge failed: {result.stderr}', 'error')
-
-        # Store output for display
-        current_app.config['LAST_BUILD_OUTPUT'] = result.stdout + result.stderr
-
-    except subprocess.TimeoutExpired:
-        flash('Merge timed out after 10 minutes', 'error')
-    except Exception as e:
-        flash(f'Error running merge: {str(e)}', 'error')
-    finally:
-        # Cleanup uploaded file
-        if plus_path.exists():
-            plus_path.unlink()
-
-    return redirect(url_for('worlds.index'))
+    start_job(current_app._get_current_object(), job_id,
+              ['--merge', world_id, world['db_path'], plus_path])
+    return job_response(job_id, f'Merge started (job {job_id}).')
+
+
+def upload_response(job_id):
+    """JSON state of a chunked upload, with where to send each file's chunks."""
+    uploads = {}
+    for field in UPLOAD_FIELDS:
+        upload = get_upload(job_id, field)
+        if upload:
+            upload['url'] = url_for('worlds.upload_chunk', job_id=job_id, field=field)
+            uploads[field] = upload
+    return {
+        'job_id': job_id,
+        'status': get_job(job_id)['status'],
+        'uploads': uploads,
+        'status_url': url_for('worlds.job_status', job_id=job_id),
+        'events_url': url_for('worlds.job_events', job_id=job_id),
+    }
+
+
+def start_uploaded_job(job):
+    """Start the build.py run of a chunked upload job on its uploaded files."""
+    work_dir = Path(job['work_dir'])
+    paths = {}
+    for field in UPLOAD_FIELDS:
+        upload = get_upload(job['id'], field)
+        if upload:
+            paths[field] = work_dir / upload['filename']
+
+    if job['kind'] == 'merge':
+        world = get_master_db().execute("SELECT db_path FROM worlds WHERE id = ?", (job['world_id'],)).fetchone()
+        args = ['--merge', job['world_id'], world['db_path'], paths['legends_plus']]
+    else:
+        args = [paths['legends']] + ([paths['legends_plus']] if 'legends_plus' in paths else [])
+        if job['kind'] == 'update':
+            args.insert(0, '--update')
+    start_job(current_app._get_current_object(), job['id'], args)
+
+
+@worlds_bp.route('/uploads', methods=['POST'])
+def create_chunked_upload():
+    """
+    Start a chunked upload of exports, as JSON: {"legends": {"filename",
+    "size"}, "legends_plus": {...}}, or {"world_id", "legends_plus"} to
+    merge into a world. Chunks are then PUT to each file's url in order.
+    With "update": true, the exports update the world of the same name.
+
+    The import starts right away and parses the bytes as they arrive, so
+    uploading and importing overlap. Zip archives can only be read once
+    complete, so their import starts after the last chunk.
+    """
+    data = request.get_json(silent=True) or {}
+    world_id = data.get('world_id')
+    required = 'legends_plus' if world_id else 'legends'
+
+    if world_id:
+        world = get_master_db().execute("SELECT * FROM worlds WHERE id = ?", (world_id,)).fetchone()
+        if not world:
+            return jsonify({'error': 'World not found'}), 404
+        if world['has_plus']:
+            return jsonify({'error': 'This world already has legends_plus data'}), 409
+        if world['status'] == 'partial':
+            return jsonify({'error': 'This world is still importing'}), 409
+
+    files = {}
+    for field in (('legends_plus',) if world_id else UPLOAD_FIELDS):
+        spec = data.get(field)
+        if not spec:
+            continue
+        filename = export_filename(field, str(spec.get('filename', '')))
+        size = spec.get('size')
+        if filename is None or not isinstance(size, int) or size < 0:
+            return jsonify({'error': f'{field} needs a size and a filename (.xml, .gz, .bz2, .xz or .zip)'}), 400
+        files[field] = (filename, size)
+    if required not in files:
+        return jsonify({'error': f'{required} is required'}), 400
+
+    kind = 'merge' if world_id else ('update' if data.get('update') else 'import')
+    job_id, work_dir = create_job(kind, world_id,
+                                  status='uploading' if any(
+                                      filename.endswith(ARCHIVE_SUFFIX) for filename, _ in files.values()
+                                  ) else 'queued')
+    for filename, size in files.values():
+        create_upload(work_dir, filename, size)
+
+    job = get_job(job_id)
+    if job['status'] == 'queued':
+        start_uploaded_job(job)
+    return jsonify(upload_response(job_id)), 201
+
+
+@worlds_bp.route('/uploads/<job_id>')
+def chunked_upload_status(job_id):
+    """Get how much of each file of a chunked upload has arrived, to resume it."""
+    if not get_job(job_id):
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(upload_response(job_id))
+
+
+@worlds_bp.route('/uploads/<job_id>/<field>', methods=['PUT'])
+def upload_chunk(job_id, field):
+    """
+    Append the request body to a file of a chunked upload. ?offset= must be
+    the number of bytes received so far; otherwise nothing is written and
+    the reply (409) says where to continue.
+    """
+    job = get_job(job_id)
+    if not job or get_upload(job_id, field) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    if job['status'] in ('done', 'failed'):
+        return jsonify({'error': f"Job has {job['status']}", 'job': public_job(job)}), 409
+
+    offset = request.args.get('offset', type=int)
+    upload, written = append_upload_chunk(job_id, field, offset, request.stream, request.content_length)
+    if not written:
+        return jsonify({'error': 'Chunk does not continue the upload', 'upload': upload}), 409
+
+    # Jobs waiting for an archive start once every file has arrived
+    if queue_uploaded_job(job_id):
+        start_uploaded_job(job)
+    return jsonify(upload)
 
 
 @worlds_bp.route('/upload-map/<world_id>', methods=['POST'])
@@ -289,6 +389,66 @@ def world_map_image(world_id):
 
 @worlds_bp.route('/build-output')
 def build_output():
-    """Show last build output."""
-    output = current_app.config.get('LAST_BUILD_OUTPUT', 'No build output available.')
-    return render_template('output.html', output=output)
+    """Show the output of an import job (the latest one by default)."""
+    job_id = request.args.get('job')
+    if job_id:
+        job = get_job(job_id)
+    else:
+        jobs = list_jobs(limit=1)
+        job = jobs[0] if jobs else None
+
+    output = get_job_output(job['id']) if job else None
+    return render_template('output.html', output=output or 'No build output available.', job=job)
+
+
+@worlds_bp.route('/jobs')
+def jobs():
+    """List recent import jobs as JSON."""
+    return jsonify(list_jobs(limit=request.args.get('limit', 20, type=int)))
+
+
+@worlds_bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Get the status of an import job as JSON."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(public_job(job))
+
+
+@worlds_bp.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Stream the progress events of an import job as Server-Sent Events.
+    Each event's id is its offset in the progress log, so a reconnecting
+    EventSource resumes where it left off. Ends with an 'end' event
+    carrying the job once it has finished.
+    """
+    if not get_job(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    offset = request.headers.get('Last-Event-ID', 0, type=int)
+
+    def generate(offset):
+        last_sent = time.monotonic()
+        status_due = 0
+        while True:
+            # Check status first so events written just before finishing are still sent
+            job = None
+            if time.monotonic() >= status_due:
+                job = get_job(job_id)
+                status_due = time.monotonic() + PROGRESS_STATUS_INTERVAL
+            events, offset = read_job_progress(job_id, offset)
+            for event in events:
+                yield f"id: {offset}\ndata: {json.dumps(event)}\n\n"
+                last_sent = time.monotonic()
+            if job and job['status'] in ('done', 'failed'):
+                yield f"event: end\ndata: {json.dumps(public_job(job))}\n\n"
+                return
+            if time.monotonic() - last_sent >= PROGRESS_KEEPALIVE:
+                # Comment line, so dropped connections are noticed
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(PROGRESS_POLL_INTERVAL)
+
+    return Response(generate(offset), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
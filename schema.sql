@@ -177,7 +177,8 @@ CREATE INDEX IF NOT EXISTS idx_artifacts_type ON artifacts(item_type);
 CREATE INDEX IF NOT EXISTS idx_artifacts_creator ON artifacts(creator_hfid);
 CREATE INDEX IF NOT EXISTS idx_artifacts_name ON artifacts(name COLLATE NOCASE);
 
--- Historical events (polymorphic)
+-- Historical events (polymorphic). Only the columns lists and lookups use
+-- are kept here; the other fields of each event are in event_extra.
 CREATE TABLE IF NOT EXISTS historical_events (
     id INTEGER PRIMARY KEY,
     year INTEGER,
@@ -192,12 +193,47 @@ CREATE TABLE IF NOT EXISTS historical_events (
     artifact_id INTEGER,
     entity_id INTEGER,
     structure_id INTEGER,
-    extra_data TEXT  -- JSON string
+    -- Ids from extra_data that lookups search by (see EVENT_EXTRA_COLUMNS in build.py)
+    hfid2 INTEGER,
+    victim_hf INTEGER,
+    item_id INTEGER,
+    subregion_id INTEGER,
+    feature_layer_id INTEGER,
+    mountain_peak_id INTEGER,
+    creator_hfid INTEGER,
+    histfig INTEGER
 );
 CREATE INDEX IF NOT EXISTS idx_events_year ON historical_events(year);
 CREATE INDEX IF NOT EXISTS idx_events_type ON historical_events(type);
 CREATE INDEX IF NOT EXISTS idx_events_site ON historical_events(site_id);
 CREATE INDEX IF NOT EXISTS idx_events_hfid ON historical_events(hfid);
+-- Most events have none of these, so only rows that do are indexed
+CREATE INDEX IF NOT EXISTS idx_events_slayer ON historical_events(slayer_hfid, year) WHERE slayer_hfid IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_artifact ON historical_events(artifact_id, year) WHERE artifact_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_hfid2 ON historical_events(hfid2, year) WHERE hfid2 IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_victim ON historical_events(victim_hf, year) WHERE victim_hf IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_item ON historical_events(item_id, year) WHERE item_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_subregion ON historical_events(subregion_id, year) WHERE subregion_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_feature_layer ON historical_events(feature_layer_id, year) WHERE feature_layer_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_peak ON historical_events(mountain_peak_id, year) WHERE mountain_peak_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_creator ON historical_events(creator_hfid, year) WHERE creator_hfid IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_events_histfig ON historical_events(histfig, year) WHERE histfig IS NOT NULL;
+
+-- Fields of historical events without a column of their own, for the
+-- events that have any; read only for the events being shown
+CREATE TABLE IF NOT EXISTS event_extra (
+    event_id INTEGER PRIMARY KEY,
+    extra_data TEXT  -- JSON string, or a compact BLOB (see extra_data.py)
+);
+
+-- Figures named by each event, one row per field (see populate_event_participants in build.py)
+CREATE TABLE IF NOT EXISTS event_participants (
+    event_id INTEGER NOT NULL,
+    hfid INTEGER NOT NULL,
+    year INTEGER,
+    role TEXT NOT NULL  -- event field naming the figure (hfid, slayer_hfid, hfid2, group, ...)
+);
+CREATE INDEX IF NOT EXISTS idx_participants_hfid ON event_participants(hfid, year, event_id);
 
 -- Written content
 CREATE TABLE IF NOT EXISTS written_content (
@@ -247,3 +283,13 @@ CREATE TABLE IF NOT EXISTS world_constructions (
     coords TEXT
 );
 CREATE INDEX IF NOT EXISTS idx_wc_type ON world_constructions(type);
+
+-- Import checkpoints, one row per pass over an export ('legends' or
+-- 'legends_plus'), so an interrupted import resumes where it stopped
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    pass TEXT PRIMARY KEY,
+    content_hash TEXT,              -- of the exports being imported
+    sections TEXT NOT NULL,         -- JSON list of the sections imported
+    last_event_id INTEGER,          -- last event imported, inside historical_events
+    complete INTEGER DEFAULT 0
+);
@@ -0,0 +1,50 @@
+"""
+World database schema for DF Tales.
+Shared by build.py, which creates and migrates world databases, and the
+web app, which checks whether a world needs migrating (see db.py)
+without loading the importer.
+"""
+
+import re
+from pathlib import Path
+
+SCHEMA_PATH = Path(__file__).parent / "schema.sql"
+
+# extra_data keys that lookups search events by, also stored in indexed
+# historical_events columns, as (column, key)
+EVENT_EXTRA_COLUMNS = (
+    ('hfid2', 'hfid2'), ('victim_hf', 'victim_hf'), ('item_id', 'item'),
+    ('subregion_id', 'subregion_id'), ('feature_layer_id', 'feature_layer_id'),
+    ('mountain_peak_id', 'mountain_peak_id'), ('creator_hfid', 'creator_hfid'), ('histfig', 'histfig'),
+)
+
+
+def read_schema():
+    """Read schema.sql and split it into (table statements, index statements)."""
+    tables, indexes = [], []
+    with open(SCHEMA_PATH) as f:
+        for line in f:
+            if line.startswith('CREATE INDEX'):
+                indexes.append(line)
+            else:
+                tables.append(line)
+    return ''.join(tables), ''.join(indexes)
+
+
+def table_columns(conn, table):
+    """Column names of a world table."""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def world_needs_migration(conn):
+    """
+    Whether a world database is missing anything of schema.sql, or still
+    has extra_data in historical_events: what build.py's migrate_world_db
+    brings up to date. Only reads the schema, so it is quick on any world.
+    """
+    tables, indexes = read_schema()
+    wanted = set(re.findall(r'CREATE (?:TABLE|INDEX) IF NOT EXISTS (\w+)', tables + indexes))
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+    columns = table_columns(conn, 'historical_events')
+    return (bool(wanted - existing) or 'extra_data' in columns
+            or any(column not in columns for column, _ in EVENT_EXTRA_COLUMNS))